@@ -2,28 +2,49 @@
 # Imports
 # ----------------------------------------------------------------------------#
 
-import logging
-from logging import Formatter, FileHandler
+from itertools import groupby
 
-import babel
-import dateutil.parser
-from flask import render_template, request, flash, redirect, url_for
+from flask import render_template, request, flash, redirect, url_for, \
+    jsonify
 # User Code
 from forms import *
 from models import *
-from sqlalchemy import func
+import booking
+import bulk_import
+import counters
+import exports
+import genres
+import matchmaking
+import pagination
+import pooling
+import request_logging
+import search
+from cache import make_cache
+from formatting import format_datetime
+from querycount import QueryCounter
+from sqlalchemy.exc import IntegrityError
 
 
-def format_datetime(value, format='medium'):
-    date = dateutil.parser.parse(value)
-    if format == 'full':
-        format = "EEEE MMMM, d, y 'at' h:mma"
-    elif format == 'medium':
-        format = "EE MM, dd, y h:mma"
-    return babel.dates.format_datetime(date, format, locale='en')
+app.jinja_env.filters['datetime'] = format_datetime
 
+detail_cache = make_cache(app.config)
+query_counter = QueryCounter(app)
 
-app.jinja_env.filters['datetime'] = format_datetime
+
+def related_ids(key, other, entity_id):
+    """Ids on the ``other`` side of every show where ``key == entity_id``."""
+    return [related_id for related_id, in db.session.query(other).filter(
+        key == entity_id).distinct()]
+
+
+def invalidate_details(venue_ids=(), artist_ids=()):
+    """Drop cached detail pages after a write.
+
+    Venue pages list artist names and images and vice versa, so callers pass
+    the entities on the other side of the changed shows too.
+    """
+    detail_cache.invalidate('venue', *venue_ids)
+    detail_cache.invalidate('artist', *artist_ids)
 
 
 # ----------------------------------------------------------------------------#
@@ -60,93 +81,93 @@ def index():
 
 @app.route('/venues')
 def venues():
-    all_areas = Venue.query.with_entities(func.count(Venue.id), Venue.city,
-                                          Venue.state).group_by(Venue.city,
-                                                                Venue.state).all()
+    genre_names, match = genres.requested()
+    venues_query = Venue.query.with_entities(
+        Venue.id, Venue.name, Venue.city, Venue.state,
+        Venue.upcoming_shows_count, venue_area[0].label('area_state'),
+        venue_area[1].label('area_city'))
+    if genre_names:
+        venues_query = venues_query.filter(
+            genres.genre_filter(Venue, genre_names, match))
+    # Pages follow ix_venue_area; an area can continue on the next page.
+    page = pagination.paginate(venues_query, [
+        pagination.Key(venue_area[0], 'area_state'),
+        pagination.Key(venue_area[1], 'area_city'),
+        pagination.Key(Venue.id)], request.args.get('cursor'),
+        pagination.per_page('VENUES_PER_PAGE'))
     data = []
 
-    for area in all_areas:
-        area_venues = Venue.query.filter_by(state=area.state).filter_by(
-            city=area.city).all()
-        venue_data = []
-        for venue in area_venues:
-            venue_data.append({
+    for (city, state), area_venues in groupby(
+            page.items, key=lambda v: (v.city, v.state)):
+        data.append({
+            "city": city,
+            "state": state,
+            "venues": [{
                 "id": venue.id,
                 "name": venue.name,
-                "num_upcoming_shows": len(
-                    db.session.query(Show).filter(
-                        Show.venue_id == 1).filter(
-                        Show.start_time > datetime.now()).all())
-            })
-        data.append({
-            "city": area.city,
-            "state": area.state,
-            "venues": venue_data
+                "num_upcoming_shows": venue.upcoming_shows_count
+            } for venue in area_venues]
         })
 
-    return render_template('pages/venues.html', areas=data)
+    return render_template(
+        'pages/venues.html', areas=data, page=page,
+        selected_genres=genre_names, match=match,
+        facets=genres.facet_counts(Venue, genre_names, match))
 
 
-@app.route('/venues/search', methods=['POST'])
+@app.route('/venues/search', methods=['GET', 'POST'])
 def search_venues():
-    search_term = request.form.get('search_term', '')
-    search_result = db.session.query(Venue).filter(
-        Venue.name.ilike(f'%{search_term}%')).all()
-    data = []
-
-    for result in search_result:
-        data.append({
-            "id": result.id,
-            "name": result.name,
-            "num_upcoming_shows": len(db.session.query(Show).filter(
-                Show.venue_id == result.id).filter(
-                Show.start_time > datetime.now()).all()),
-        })
-    response = {
-        "count": len(search_result),
-        "data": data
-    }
-    return render_template('pages/search_venues.html', results=response,
-                           search_term=request.form.get('search_term', ''))
-
-
-@app.route('/venues/<int:user_provided_venue_id>')
-def show_venue(user_provided_venue_id):
-    venue = Venue.query.get(user_provided_venue_id)
-
-    if not venue:
-        return render_template('errors/404.html')
-
-    past_shows_db = db.session.query(Show, Artist).filter(
-        Show.venue_id == user_provided_venue_id).filter(
-        Show.start_time < datetime.now()).join(Artist,
-                                               Show.artist_id == Artist.id).all()
+    search_term = request.values.get('search_term', '')
+    genre_names, match = genres.requested()
+    response = search.search_venues(
+        search_term, pagination.per_page('SEARCH_RESULT_LIMIT'),
+        genres=genre_names, match=match,
+        cursor=request.values.get('cursor'))
+    return render_template(
+        'pages/search_venues.html', results=response, page=response,
+        search_term=search_term, selected_genres=genre_names, match=match,
+        facets=genres.facet_counts(Venue, genre_names, match))
+
+
+def split_shows(rows, show_data):
+    """Split joined show rows into (past, upcoming) against one "now".
+
+    ``rows`` come from an outer join, so a row with no show has a ``None``
+    start time and is skipped.
+    """
+    now = datetime.now()
     past_shows = []
-
-    for result in past_shows_db:
-        past_shows.append({
-            "artist_id": result.Artist.id,
-            "artist_image_link": result.Artist.image_link,
-            "artist_name": result.Artist.name,
-            "start_time": result.Show.start_time.strftime(
-                '%Y-%m-%d %H:%M:%S')
-        })
-
-    upcoming_shows_db = db.session.query(Show, Artist).filter(
-        Show.venue_id == user_provided_venue_id).filter(
-        Show.start_time > datetime.now()).join(Artist,
-                                               Show.artist_id == Artist.id).all()
     upcoming_shows = []
-
-    for result in upcoming_shows_db:
-        upcoming_shows.append({
-            "artist_id": result.Artist.id,
-            "artist_name": result.Artist.name,
-            "artist_image_link": result.Artist.image_link,
-            "start_time": result.Show.start_time.strftime(
-                "%Y-%m-%d %H:%M:%S")
-        })
-    view_data = {
+    for row in rows:
+        if row.start_time is None:
+            continue
+        show = show_data(row)
+        show["start_time"] = row.start_time
+        if row.start_time > now:
+            upcoming_shows.append(show)
+        else:
+            past_shows.append(show)
+    return past_shows, upcoming_shows
+
+
+def venue_detail(venue_id):
+    rows = db.session.query(
+        Venue, Show.start_time, Artist.id.label('artist_id'),
+        Artist.name.label('artist_name'),
+        Artist.image_link.label('artist_image_link')).outerjoin(
+        Show, Show.venue_id == Venue.id).outerjoin(
+        Artist, Artist.id == Show.artist_id).filter(
+        Venue.id == venue_id).order_by(Show.start_time).all()
+    if not rows:
+        return None
+
+    venue = rows[0].Venue
+    past_shows, upcoming_shows = split_shows(rows, lambda row: {
+        "artist_id": row.artist_id,
+        "artist_name": row.artist_name,
+        "artist_image_link": row.artist_image_link,
+    })
+    return {
         "id": venue.id,
         "name": venue.name,
         "genres": venue.genres,
@@ -156,6 +177,8 @@ def show_venue(user_provided_venue_id):
         "phone": venue.phone,
         "website_link": venue.website_link,
         "facebook_link": venue.facebook_link,
+        "seeking_talent": venue.seeking_talent,
+        "seeking_description": venue.seeking_description,
         "image_link": venue.image_link,
         "past_shows": past_shows,
         "upcoming_shows": upcoming_shows,
@@ -163,15 +186,14 @@ def show_venue(user_provided_venue_id):
         "upcoming_shows_count": len(upcoming_shows),
     }
 
-    all_talents_db = db.session.query(Venue).filter(
-        Venue.id == user_provided_venue_id).all()
-    for result in all_talents_db:
-        view_data["seeking_talent"] = result.seeking_talent
-        view_data["seeking_description"] = result.seeking_description
 
-    view_data = \
-        list(filter(lambda d: d['id'] == user_provided_venue_id,
-                    [view_data]))[0]
+@app.route('/venues/<int:user_provided_venue_id>')
+def show_venue(user_provided_venue_id):
+    view_data = detail_cache.get_or_load('venue', user_provided_venue_id,
+                                         venue_detail)
+    if not view_data:
+        return render_template('errors/404.html')
+
     return render_template('pages/show_venue.html', venue=view_data)
 
 
@@ -195,8 +217,8 @@ def create_venue_submission():
             db.session.add(venue)
             db.session.commit()
             flash('Venue ' + venue.name + ' was successfully listed!')
-        except ValueError as e:
-            print(e)
+        except ValueError:
+            app.logger.exception('Failed to list a venue')
             flash('An error occurred. Venue ' + request.form[
                 'name'] + ' could not be listed.')
             db.session.rollback()
@@ -216,9 +238,12 @@ def delete_venue(venue_id):
     error = False
     try:
         venue = Venue.query.get(venue_id)
+        artist_ids = related_ids(Show.venue_id, Show.artist_id, venue_id)
         db.session.delete(venue)
         db.session.commit()
-    except Exception as e:
+        invalidate_details([venue_id], artist_ids)
+    except Exception:
+        app.logger.exception('Failed to delete a venue')
         error = True
         db.session.rollback()
     finally:
@@ -268,9 +293,11 @@ def edit_venue_submission(venue_id):
             form.populate_obj(venue_db)
             # Here always use database object and with below it would simply write
             db.session.commit()
+            invalidate_details([venue_id], related_ids(
+                Show.venue_id, Show.artist_id, venue_id))
             flash('Venue ' + venue_db.name + ' was successfully updated!')
-        except ValueError as e:
-            print('Failed to update a venue: ' + str(e))
+        except ValueError:
+            app.logger.exception('Failed to update a venue')
             flash('An error occurred. Venue ' + request.form[
                 'name'] + ' could not be updated.')
             db.session.rollback()
@@ -290,79 +317,60 @@ def edit_venue_submission(venue_id):
 #  ----------------------------------------------------------------
 @app.route('/artists')
 def artists():
-    all_artists = Artist.query.with_entities(Artist.id, Artist.name).all()
+    genre_names, match = genres.requested()
+    artists_query = Artist.query.with_entities(Artist.id, Artist.name)
+    if genre_names:
+        artists_query = artists_query.filter(
+            genres.genre_filter(Artist, genre_names, match))
+    page = pagination.paginate(artists_query, [pagination.Key(Artist.id)],
+                               request.args.get('cursor'),
+                               pagination.per_page('ARTISTS_PER_PAGE'))
     data = []
 
-    for artist in all_artists:
+    for artist in page.items:
         data.append({
             "id": artist.id,
             "name": artist.name
         })
 
-    return render_template('pages/artists.html', artists=data)
+    return render_template(
+        'pages/artists.html', artists=data, page=page,
+        selected_genres=genre_names, match=match,
+        facets=genres.facet_counts(Artist, genre_names, match))
 
 
-@app.route('/artists/search', methods=['POST'])
+@app.route('/artists/search', methods=['GET', 'POST'])
 def search_artists():
-    search_term = request.form.get('search_term', '')
-    search_result = db.session.query(Artist).filter(
-        Artist.name.ilike(f'%{search_term}%')).all()
-    data = []
-
-    for result in search_result:
-        data.append({
-            "id": result.id,
-            "name": result.name,
-            "num_upcoming_shows": len(db.session.query(Show).filter(
-                Show.artist_id == result.id).filter(
-                Show.start_time > datetime.now()).all()),
-        })
-    response = {
-        "count": len(search_result),
-        "data": data
-    }
-
-    return render_template('pages/search_artists.html', results=response,
-                           search_term=request.form.get('search_term', ''))
-
-
-@app.route('/artists/<int:user_provided_artist_id>')
-def show_artist(user_provided_artist_id):
-    artist = Artist.query.get(user_provided_artist_id)
-    if not artist:
-        return render_template('errors/404.html')
-
-    past_shows_query = db.session.query(Show, Venue).filter(
-        Show.artist_id == user_provided_artist_id).filter(
-        Show.start_time < datetime.now()).join(Venue,
-                                               Show.venue_id == Venue.id)
-    past_shows_db = past_shows_query.all()
-    past_shows = []
-    for result in past_shows_db:
-        past_shows.append({
-            "venue_id": result.Venue.id,
-            "venue_name": result.Venue.name,
-            "venue_image_link": result.Venue.image_link,
-            "start_time": result.Show.start_time.strftime(
-                '%Y-%m-%d %H:%M:%S')
-        })
-
-    upcoming_shows_db = db.session.query(Show, Venue).filter(
-        Show.artist_id == user_provided_artist_id).filter(
-        Show.start_time > datetime.now()).join(Venue,
-                                               Show.venue_id == Venue.id).all()
-    upcoming_shows = []
-
-    for result in upcoming_shows_db:
-        upcoming_shows.append({
-            "venue_id": result.Venue.id,
-            "venue_name": result.Venue.name,
-            "venue_image_link": result.Venue.image_link,
-            "start_time": result.Show.start_time.strftime(
-                '%Y-%m-%d %H:%M:%S')
-        })
-
-    data = {
+    search_term = request.values.get('search_term', '')
+    genre_names, match = genres.requested()
+    response = search.search_artists(
+        search_term, pagination.per_page('SEARCH_RESULT_LIMIT'),
+        genres=genre_names, match=match,
+        cursor=request.values.get('cursor'))
+    return render_template(
+        'pages/search_artists.html', results=response, page=response,
+        search_term=search_term, selected_genres=genre_names, match=match,
+        facets=genres.facet_counts(Artist, genre_names, match))
+
+
+def artist_detail(artist_id):
+    rows = db.session.query(
+        Artist, Show.start_time, Venue.id.label('venue_id'),
+        Venue.name.label('venue_name'),
+        Venue.image_link.label('venue_image_link')).outerjoin(
+        Show, Show.artist_id == Artist.id).outerjoin(
+        Venue, Venue.id == Show.venue_id).filter(
+        Artist.id == artist_id).order_by(Show.start_time).all()
+    if not rows:
+        return None
+
+    artist = rows[0].Artist
+    past_shows, upcoming_shows = split_shows(rows, lambda row: {
+        "venue_id": row.venue_id,
+        "venue_name": row.venue_name,
+        "venue_image_link": row.venue_image_link,
+    })
+    return {
         "id": artist.id,
         "name": artist.name,
         "genres": artist.genres,
@@ -380,8 +388,14 @@ def show_artist(user_provided_artist_id):
         "upcoming_shows_count": len(upcoming_shows),
     }
 
-    data = \
-    list(filter(lambda d: d['id'] == user_provided_artist_id, [data]))[0]
+
+@app.route('/artists/<int:user_provided_artist_id>')
+def show_artist(user_provided_artist_id):
+    data = detail_cache.get_or_load('artist', user_provided_artist_id,
+                                    artist_detail)
+    if not data:
+        return render_template('errors/404.html')
+
     return render_template('pages/show_artist.html', artist=data)
 
 
@@ -395,9 +409,11 @@ def edit_artist_submission(artist_id):
         try:
             form.populate_obj(artist_db)
             db.session.commit()
+            invalidate_details(related_ids(
+                Show.artist_id, Show.venue_id, artist_id), [artist_id])
             flash('Artist ' + artist_db.name + ' was successfully updated!')
-        except Exception as e:
-            print('Failed to update a Artist: ' + str(e))
+        except Exception:
+            app.logger.exception('Failed to update an artist')
             db.session.rollback()
             flash(
                 'An error occurred. Artist ' + data.name + ' could not be updated.')
@@ -462,8 +478,8 @@ def create_artist_submission():
             flash(
                 'Artist ' + request.form[
                     'name'] + ' was successfully listed!')
-        except Exception as e:  # work on python 2.x
-            print('Failed to list artist: ' + str(e))
+        except Exception:  # work on python 2.x
+            app.logger.exception('Failed to list an artist')
             db.session.rollback()
             flash('An error occurred. Artist ' + request.form[
                 'name'] + ' could not be listed.')
@@ -485,10 +501,12 @@ def delete_artist(artist_id):
     error = False
     try:
         artist = Artist.query.get(artist_id)
+        venue_ids = related_ids(Show.artist_id, Show.venue_id, artist_id)
         db.session.delete(artist)
         db.session.commit()
-    except Exception as e:
-        print('Failed to delete artist: ' + str(e))
+        invalidate_details(venue_ids, [artist_id])
+    except Exception:
+        app.logger.exception('Failed to delete an artist')
         error = True
         db.session.rollback()
     finally:
@@ -507,27 +525,34 @@ def delete_artist(artist_id):
 
 @app.route('/shows')
 def shows():
+    page_size = pagination.per_page('SHOWS_PER_PAGE')
+    shows_query = db.session.query(
+        Show.id, Show.start_time,
+        Venue.id.label('venue_id'), Venue.name.label('venue_name'),
+        Artist.id.label('artist_id'), Artist.name.label('artist_name'),
+        Artist.image_link.label('artist_image_link')).join(
+        Artist, Artist.id == Show.artist_id).join(
+        Venue, Venue.id == Show.venue_id)
+
+    # Keyset pagination on (start_time, id), so deep pages cost the same
+    # as the first one.
+    page = pagination.paginate(
+        shows_query,
+        [pagination.Key(Show.start_time), pagination.Key(Show.id)],
+        request.args.get('cursor'), page_size)
+
     data = []
-    all_shows = Show.query.all()
-    for show in all_shows:
-        shows_query = db.session.query(Show, Artist, Venue). \
-            filter(Show.id == show.id).join(Artist,
-                                            Artist.id == Show.artist_id).join(
-            Venue, Venue.id == Show.venue_id)
-        result_set = shows_query.all()
-        print(result_set)
-        for result in result_set:
-            data.append({
-                "venue_id": result.Venue.id,
-                "venue_name": result.Venue.name,
-                "artist_id": result.Artist.id,
-                "artist_name": result.Artist.name,
-                "artist_image_link": result.Artist.image_link,
-                "start_time": result.Show.start_time.strftime(
-                    '%Y-%m-%d %H:%M:%S')
-            })
-
-    return render_template('pages/shows.html', shows=data)
+    for result in page.items:
+        data.append({
+            "venue_id": result.venue_id,
+            "venue_name": result.venue_name,
+            "artist_id": result.artist_id,
+            "artist_name": result.artist_name,
+            "artist_image_link": result.artist_image_link,
+            "start_time": result.start_time
+        })
+
+    return render_template('pages/shows.html', shows=data, page=page)
 
 
 @app.route('/shows/create', methods=['GET'])
@@ -543,14 +568,28 @@ def create_show_submission():
         try:
             show = Show()
             form.populate_obj(show)
+            conflicts = booking.find_conflicts(
+                show.venue_id, show.artist_id, show.start_time)
+            if conflicts:
+                flash('Show could not be listed: it overlaps ' + ', '.join(
+                    'show {} at {}'.format(other.id, other.start_time)
+                    for other in conflicts) + '.')
+                return render_template('pages/home.html')
             db.session.add(show)
             db.session.commit()
-            flash('Show ' + show.name + ' was successfully listed!')
-        except Exception as e:  # work on python 2.x
-            print('Failed to list a show: ' + str(e))
+            invalidate_details([show.venue_id], [show.artist_id])
+            flash('Show was successfully listed!')
+        except IntegrityError:
+            # Lost a race to a concurrent booking; the exclusion
+            # constraints reject the overlap.
+            app.logger.exception('Failed to list a show')
             db.session.rollback()
-            flash(
-                'An error occurred. Show ' + name + ' could not be listed.')
+            flash('An error occurred. Show overlaps another booking and '
+                  'could not be listed.')
+        except Exception:  # work on python 2.x
+            app.logger.exception('Failed to list a show')
+            db.session.rollback()
+            flash('An error occurred. Show could not be listed.')
         finally:
             db.session.close()
     else:
@@ -562,26 +601,66 @@ def create_show_submission():
     return render_template('pages/home.html')
 
 
+@app.route('/shows/availability', methods=['POST'])
+def shows_availability():
+    """Check candidate slots before booking.
+
+    Takes ``{"slots": [{"venue_id", "artist_id", "start_time"}, ...]}``
+    with ISO 8601 start times and returns one result per slot. Start times
+    with a UTC offset are converted to the server's local time, which is
+    how show times are stored.
+    """
+    body = request.get_json(silent=True)
+    if body is None:
+        body = {}
+    if not isinstance(body, dict) or \
+            not isinstance(body.get('slots', []), list):
+        return jsonify({'error': 'expected an object with a list of '
+                                 'slots'}), 400
+    try:
+        slots = [{
+            'venue_id': int(slot['venue_id']),
+            'artist_id': int(slot['artist_id']),
+            'start_time': booking.naive_local(
+                datetime.fromisoformat(slot['start_time'])),
+        } for slot in body.get('slots', [])]
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'error': 'each slot needs venue_id, artist_id and '
+                                 'an ISO 8601 start_time'}), 400
+    return jsonify({'slots': booking.check_availability(slots)})
+
+
+#  Internal
+#  ----------------------------------------------------------------
+
+@app.route('/internal/cache')
+def cache_stats():
+    return jsonify(detail_cache.stats())
+
+
+@app.route('/internal/pool')
+def pool_stats():
+    return jsonify(pooling.pool_stats(db.engine,
+                                      app.config['DB_POOL_PROFILE']))
+
+
 @app.errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
 
 
+@app.errorhandler(pagination.InvalidCursor)
+def invalid_cursor(error):
+    # A malformed or tampered cursor is the client's mistake.
+    return render_template('errors/400.html'), 400
+
+
 @app.errorhandler(500)
 def server_error(error):
     return render_template('errors/500.html'), 500
 
 
-if not app.debug:
-    file_handler = FileHandler('error.log')
-    file_handler.setFormatter(
-        Formatter(
-            '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
-    )
-    app.logger.setLevel(logging.INFO)
-    file_handler.setLevel(logging.INFO)
-    app.logger.addHandler(file_handler)
-    app.logger.info('errors')
+request_logging.init_logging(app)
 
 # ----------------------------------------------------------------------------#
 # Launch.
@@ -0,0 +1,70 @@
+"""Micro-benchmark: the old ``datetime`` filter against formatting.py.
+
+Formats one /shows page worth of start times (default 100) in three ways:
+
+* ``legacy`` -- what the filter used to do: strftime in the view, then
+  ``dateutil.parser.parse`` and ``babel.dates.format_datetime`` per value.
+* ``filter`` -- ``formatting.format_datetime`` called per ``datetime``.
+* ``batch``  -- ``formatting.format_datetimes`` over the whole list.
+
+Run from the project directory:
+
+    python benchmarks/bench_format_datetime.py [--rows 100] [--repeat 50]
+"""
+import argparse
+import os
+import sys
+import timeit
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import babel.dates  # noqa: E402
+import dateutil.parser  # noqa: E402
+
+from formatting import FORMATS, format_datetime, format_datetimes  # noqa: E402
+
+
+def legacy_format_datetime(value, format='medium'):
+    date = dateutil.parser.parse(value)
+    if format == 'full':
+        format = "EEEE MMMM, d, y 'at' h:mma"
+    elif format == 'medium':
+        format = "EE MM, dd, y h:mma"
+    return babel.dates.format_datetime(date, format, locale='en')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    start = datetime(2026, 1, 1, 20, 30)
+    values = [start + timedelta(hours=7 * i) for i in range(args.rows)]
+
+    def legacy():
+        return [legacy_format_datetime(v.strftime('%Y-%m-%d %H:%M:%S'),
+                                       'full') for v in values]
+
+    def per_value():
+        return [format_datetime(v, 'full') for v in values]
+
+    def batch():
+        return format_datetimes(values, 'full')
+
+    assert legacy() == per_value() == batch(), 'implementations disagree'
+
+    print('{} rows, format {!r}, best of {} runs'.format(
+        args.rows, FORMATS['full'], args.repeat))
+    baseline = None
+    for name, fn in (('legacy', legacy), ('filter', per_value),
+                     ('batch', batch)):
+        best = min(timeit.repeat(fn, number=1, repeat=args.repeat))
+        baseline = baseline or best
+        print('{:<8} {:9.3f} ms  {:6.1f}x'.format(
+            name, best * 1000, baseline / best))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,218 @@
+"""Benchmark every read-only Fyyur route through the Flask test client.
+
+For each route the first request warms the caches and lazily built indexes
+and is not counted. The next ``--requests`` requests are timed, reading the
+whole body, so the streamed /export routes are timed to their last byte.
+The venue and artist detail pages are measured twice: warm, served from the
+detail cache, and cold (``venue_cold``, ``artist_cold``), with the cache
+cleared before every request so the detail query itself is measured. The
+report records:
+
+* ``p50_ms`` / ``p95_ms`` -- latency percentiles,
+* ``queries`` -- SQL statements per request, from the X-Query-Count header;
+  for the streamed exports it covers only the statements run before the
+  body starts,
+* ``peak_kib`` -- peak Python memory allocated during one more request,
+  measured with tracemalloc in a separate untimed pass.
+
+Seed the database first (see seed_data.py); the routes use whatever rows
+are there. With ``--baseline`` the run is compared with an earlier report.
+A route regresses when its p95 grows by more than ``--tolerance`` or it runs
+more queries. Any regression makes the exit status 1.
+
+Run from the project directory, against DATABASE_URL or FYYUR_SQLITE:
+
+    python benchmarks/bench_routes.py --output report.json \\
+        [--baseline baseline.json] [--requests 50] [--only venues]
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import resource
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app, detail_cache  # noqa: E402
+from models import db, Venue, Artist, Show  # noqa: E402
+from pagination import NEXT, encode_cursor  # noqa: E402
+
+
+def routes():
+    """``[(name, method, url, request kwargs, cold)]`` for the seeded data.
+
+    ``cold`` routes are measured with the detail cache cleared before each
+    request.
+    """
+    venue_id = db.session.query(db.func.min(Venue.id)).scalar()
+    artist_id = db.session.query(db.func.min(Artist.id)).scalar()
+    if venue_id is None or artist_id is None:
+        raise SystemExit('No venues or artists; run seed_data.py first.')
+    middle = Show.query.order_by(Show.start_time, Show.id).offset(
+        Show.query.count() // 2).first()
+    start = datetime.now().replace(microsecond=0) + timedelta(days=1)
+    slots = [{'venue_id': venue_id, 'artist_id': artist_id,
+              'start_time': (start + timedelta(hours=4 * i)).isoformat()}
+             for i in range(10)]
+
+    venue_url = '/venues/{}'.format(venue_id)
+    artist_url = '/artists/{}'.format(artist_id)
+    table = [
+        ('index', 'GET', '/', {}),
+        ('venues', 'GET', '/venues', {}),
+        ('venues_genre', 'GET', '/venues?genre=Jazz', {}),
+        ('venue', 'GET', venue_url, {}),
+        ('venue_cold', 'GET', venue_url, {}, True),
+        ('venue_edit', 'GET', venue_url + '/edit', {}),
+        ('venue_recommendations', 'GET', venue_url + '/recommendations', {}),
+        ('search_venues', 'POST', '/venues/search',
+         {'data': {'search_term': 'venue 1'}}),
+        ('artists', 'GET', '/artists', {}),
+        ('artists_genre', 'GET', '/artists?genre=Jazz', {}),
+        ('artist', 'GET', artist_url, {}),
+        ('artist_cold', 'GET', artist_url, {}, True),
+        ('artist_edit', 'GET', artist_url + '/edit', {}),
+        ('artist_recommendations', 'GET', artist_url + '/recommendations',
+         {}),
+        ('search_artists', 'POST', '/artists/search',
+         {'data': {'search_term': 'artist 1'}}),
+        ('shows', 'GET', '/shows', {}),
+        ('shows_availability', 'POST', '/shows/availability',
+         {'json': {'slots': slots}}),
+        ('create_venue_form', 'GET', '/venues/create', {}),
+        ('create_artist_form', 'GET', '/artists/create', {}),
+        ('create_show_form', 'GET', '/shows/create', {}),
+    ]
+    if middle is not None:
+        table.append(('shows_deep', 'GET', '/shows?cursor=' + encode_cursor(
+            [middle.start_time, middle.id], NEXT), {}))
+    for entity in ('venues', 'artists', 'shows'):
+        for fmt in ('ndjson', 'csv'):
+            table.append(('export_{}_{}'.format(entity, fmt), 'GET',
+                          '/export/{}.{}'.format(entity, fmt), {}))
+    return [entry if len(entry) == 5 else entry + (False,)
+            for entry in table]
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of ``values``."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def measure(client, method, url, kwargs, count, cold=False):
+    def call():
+        response = client.open(url, method=method, **kwargs)
+        response.get_data()
+        if response.status_code >= 400:
+            raise SystemExit('{} {} returned {}'.format(
+                method, url, response.status_code))
+        return int(response.headers.get('X-Query-Count', 0))
+
+    call()
+    timings, queries = [], []
+    for _ in range(count):
+        if cold:
+            detail_cache.clear()
+        started = time.perf_counter()
+        queries.append(call())
+        timings.append(time.perf_counter() - started)
+
+    if cold:
+        detail_cache.clear()
+    tracemalloc.start()
+    try:
+        call()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'p50_ms': round(percentile(timings, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(timings, 0.95) * 1000, 3),
+        'queries': max(queries),
+        'peak_kib': round(peak / 1024, 1),
+    }
+
+
+def compare(report, baseline, tolerance):
+    """Return ``[(route, message)]`` for routes worse than the baseline."""
+    regressions = []
+    for name, result in sorted(report['routes'].items()):
+        before = baseline['routes'].get(name)
+        if before is None:
+            continue
+        if result['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+            regressions.append((name, 'p95 {} ms -> {} ms'.format(
+                before['p95_ms'], result['p95_ms'])))
+        if result['queries'] > before['queries']:
+            regressions.append((name, 'queries {} -> {}'.format(
+                before['queries'], result['queries'])))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=50,
+                        help='Timed requests per route.')
+    parser.add_argument('--only', action='append', default=[],
+                        help='Run only this route (repeatable).')
+    parser.add_argument('--output', help='Write the JSON report here.')
+    parser.add_argument('--baseline',
+                        help='Compare with this earlier JSON report.')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='Allowed p95 growth over the baseline.')
+    args = parser.parse_args()
+
+    # Report repeated statements in the counts instead of failing on them.
+    app.config['QUERYCOUNT_RAISE'] = False
+    client = app.test_client()
+    report = {
+        'meta': {
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'database': db.engine.dialect.name,
+            'requests_per_route': args.requests,
+        },
+        'routes': {},
+    }
+    with app.app_context():
+        table = routes()
+        report['meta'].update(
+            venues=Venue.query.count(), artists=Artist.query.count(),
+            shows=Show.query.count())
+
+    print('{:<24} {:>9} {:>9} {:>8} {:>10}'.format(
+        'route', 'p50 ms', 'p95 ms', 'queries', 'peak KiB'))
+    for name, method, url, kwargs, cold in table:
+        if args.only and name not in args.only:
+            continue
+        result = measure(client, method, url, kwargs, args.requests, cold)
+        report['routes'][name] = result
+        print('{:<24} {p50_ms:9.2f} {p95_ms:9.2f} {queries:8d} '
+              '{peak_kib:10.1f}'.format(name, **result))
+    # ru_maxrss is in KiB on Linux.
+    report['meta']['max_rss_kib'] = \
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for name, message in regressions:
+            print('REGRESSION {}: {}'.format(name, message))
+        if regressions:
+            raise SystemExit(1)
+        print('No regressions against {}.'.format(args.baseline))
+
+
+if __name__ == '__main__':
+    main()
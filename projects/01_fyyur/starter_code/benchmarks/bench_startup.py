@@ -0,0 +1,178 @@
+"""Benchmark a cold Fyyur worker: import time plus the first request.
+
+Every run is a fresh interpreter, like a newly forked or autoscaled worker.
+It times ``import app`` and then the first request to ``--path``, which
+pays for the lazy work: the first connection, template compilation and
+any imports deferred until use. The report gives the median and p95 of
+each phase over ``--runs`` runs. ``--importtime`` also lists the slowest
+imports of one run (python -X importtime).
+
+By default the app runs against a throwaway SQLite file created with
+``init_db()``, so no database server is needed. Set ``--database-url`` to
+measure against a real database. With ``--baseline`` the run is compared
+with an earlier report, and a median that grew by more than
+``--tolerance`` makes the exit status 1.
+
+Run from the project directory:
+
+    python benchmarks/bench_startup.py --runs 20 --output startup.json \\
+        [--baseline startup-baseline.json] [--importtime]
+"""
+import argparse
+import json
+import math
+import os
+import subprocess
+import sys
+import tempfile
+from datetime import datetime
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in the child interpreter; prints one JSON line.
+CHILD = '''
+import json, sys, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+response = app.app.test_client().get(sys.argv[1])
+finished = time.perf_counter()
+print(json.dumps({
+    "import_ms": (imported - started) * 1000,
+    "first_request_ms": (finished - imported) * 1000,
+    "status": response.status_code,
+    "modules": len(sys.modules),
+}))
+'''
+
+PHASES = ('import_ms', 'first_request_ms', 'total_ms')
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of ``values``."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def child_env(args, sqlite_path):
+    env = dict(os.environ)
+    env.pop('FLASK_RUN_FROM_CLI', None)
+    env['LOG_FILE'] = os.devnull
+    if args.database_url:
+        env.pop('FYYUR_SQLITE', None)
+        env['DATABASE_URL'] = args.database_url
+    else:
+        env['FYYUR_SQLITE'] = sqlite_path
+    return env
+
+
+def run_child(env, path, importtime=False):
+    command = [sys.executable] + (['-X', 'importtime'] if importtime
+                                  else []) + ['-c', CHILD, path]
+    result = subprocess.run(command, cwd=PROJECT_DIR, env=env,
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        raise SystemExit(result.stderr)
+    sample = json.loads(result.stdout.strip().splitlines()[-1])
+    if sample['status'] >= 400:
+        raise SystemExit('{} returned {}'.format(path, sample['status']))
+    sample['total_ms'] = sample['import_ms'] + sample['first_request_ms']
+    return sample, result.stderr
+
+
+def slowest_imports(stderr, count):
+    """``[(cumulative us, module)]`` for the app's own imports, slowest first.
+
+    ``-X importtime`` indents each module by two spaces per level of nesting,
+    so the modules imported directly by ``app`` are at depth one.
+    """
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if (len(name) - len(name.lstrip()) - 1) // 2 == 1:
+            imports.append((int(cumulative), name.strip()))
+    return sorted(imports, reverse=True)[:count]
+
+
+def init_sqlite(env):
+    subprocess.run([sys.executable, '-c',
+                    'import models; models.init_db()'],
+                   cwd=PROJECT_DIR, env=env, check=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--path', default='/',
+                        help='URL of the first request.')
+    parser.add_argument('--database-url',
+                        help='Use this database instead of a SQLite file.')
+    parser.add_argument('--importtime', action='store_true',
+                        help='Also list the slowest imports.')
+    parser.add_argument('--output', help='Write the JSON report here.')
+    parser.add_argument('--baseline',
+                        help='Compare with this earlier JSON report.')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='Allowed growth of each median.')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as scratch:
+        env = child_env(args, os.path.join(scratch, 'fyyur.db'))
+        if not args.database_url:
+            init_sqlite(env)
+        samples = [run_child(env, args.path)[0] for _ in range(args.runs)]
+        if args.importtime:
+            _, stderr = run_child(env, args.path, importtime=True)
+
+    report = {
+        'meta': {
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'python': sys.version.split()[0],
+            'database': 'url' if args.database_url else 'sqlite',
+            'path': args.path,
+            'runs': args.runs,
+            'modules': samples[-1]['modules'],
+        },
+        'phases': {},
+    }
+    for phase in PHASES:
+        values = [sample[phase] for sample in samples]
+        report['phases'][phase] = {
+            'p50_ms': round(percentile(values, 0.50), 3),
+            'p95_ms': round(percentile(values, 0.95), 3),
+        }
+        print('{:<18} p50 {:9.2f} ms   p95 {:9.2f} ms'.format(
+            phase, report['phases'][phase]['p50_ms'],
+            report['phases'][phase]['p95_ms']))
+    print('{} modules loaded'.format(report['meta']['modules']))
+
+    if args.importtime:
+        print('\nslowest imports (cumulative):')
+        for micros, name in slowest_imports(stderr, 10):
+            print('{:>10.1f} ms  {}'.format(micros / 1000, name))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = []
+        for phase, result in sorted(report['phases'].items()):
+            before = baseline['phases'].get(phase)
+            if before and result['p50_ms'] > \
+                    before['p50_ms'] * (1 + args.tolerance):
+                regressions.append('{}: p50 {} ms -> {} ms'.format(
+                    phase, before['p50_ms'], result['p50_ms']))
+        for message in regressions:
+            print('REGRESSION ' + message)
+        if regressions:
+            raise SystemExit(1)
+        print('No regressions against {}.'.format(args.baseline))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,182 @@
+"""Fill the configured database with a synthetic Fyyur dataset.
+
+Scales are named after the number of shows:
+
+* ``1k``   --    50 venues,    100 artists,     1,000 shows
+* ``100k`` -- 2,000 venues,  5,000 artists,   100,000 shows
+* ``1m``   -- 10,000 venues, 25,000 artists, 1,000,000 shows
+
+The same ``--seed`` always produces the same rows. Shows are laid out one
+per venue per day, with a different artist at every venue on a given day,
+so they never trip the booking overlap constraints. Half of them are in the
+past and half upcoming. Rows go through ``bulk_import.insert_batch``, which
+uses COPY on PostgreSQL and maintains the upcoming show counters; a counter
+sweep at the end retires the past shows.
+
+Missing tables are created first, so a new SQLite file works as is. Run
+from the project directory, against DATABASE_URL or FYYUR_SQLITE:
+
+    python benchmarks/seed_data.py --scale 100k [--reset] [--seed 1]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text  # noqa: E402
+
+import counters  # noqa: E402
+from bulk_import import insert_batch  # noqa: E402
+from forms import genres_choices, state_choices  # noqa: E402
+from models import db, init_db, Venue, Artist, Show  # noqa: E402
+
+SCALES = {
+    '1k': (50, 100, 1000),
+    '100k': (2000, 5000, 100000),
+    '1m': (10000, 25000, 1000000),
+}
+
+GENRES = [genre for genre, _ in genres_choices]
+STATES = [state for state, _ in state_choices]
+# Venues and artists share this many cities, so area listings group rows.
+VENUES_PER_CITY = 20
+
+
+def _genres(rng):
+    return sorted(rng.sample(GENRES, rng.randint(1, 3)))
+
+
+def _area(rng, n_cities):
+    city = rng.randrange(n_cities)
+    return 'City {}'.format(city), STATES[city % len(STATES)]
+
+
+def venue_rows(rng, count, n_cities):
+    for i in range(count):
+        city, state = _area(rng, n_cities)
+        yield {
+            'name': 'Venue {}'.format(i),
+            'city': city,
+            'state': state,
+            'address': '{} Main Street'.format(rng.randint(1, 9999)),
+            'phone': '555-{:03d}-{:04d}'.format(rng.randint(100, 999),
+                                                rng.randint(0, 9999)),
+            'genres': _genres(rng),
+            'seeking_talent': 'true' if rng.random() < 0.3 else 'false',
+            'upcoming_shows_count': 0,
+        }
+
+
+def artist_rows(rng, count, n_cities):
+    for i in range(count):
+        city, state = _area(rng, n_cities)
+        yield {
+            'name': 'Artist {}'.format(i),
+            'city': city,
+            'state': state,
+            'phone': '555-{:03d}-{:04d}'.format(rng.randint(100, 999),
+                                                rng.randint(0, 9999)),
+            'genres': _genres(rng),
+            'seeking_venue': 'true' if rng.random() < 0.3 else 'false',
+            'upcoming_shows_count': 0,
+        }
+
+
+def show_rows(rng, count, venue_ids, artist_ids, now):
+    """One show per venue per day; artists rotate so none is double booked."""
+    days = -(-count // len(venue_ids))
+    first_day = (now - timedelta(days=days // 2)).replace(
+        hour=0, minute=0, second=0, microsecond=0)
+    for i in range(count):
+        venue, day = i % len(venue_ids), i // len(venue_ids)
+        offset = day * 7919 % len(artist_ids)
+        yield {
+            'venue_id': venue_ids[venue],
+            'artist_id': artist_ids[(venue + offset) % len(artist_ids)],
+            'start_time': first_day + timedelta(
+                days=day, hours=rng.choice((18, 19, 20, 21))),
+        }
+
+
+def insert(model, rows, batch_size):
+    """Insert ``rows`` in batches of ``batch_size``."""
+    batch, count = [], 0
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            insert_batch(model, batch)
+            count += len(batch)
+            del batch[:]
+            print('{}: {} rows'.format(model.__tablename__, count))
+    if batch:
+        insert_batch(model, batch)
+
+
+def insert_entities(model, rows, batch_size):
+    """Insert venue or artist ``rows``; returns the new ids in order."""
+    start = db.session.query(db.func.max(model.id)).scalar() or 0
+    insert(model, rows, batch_size)
+    return [id for id, in db.session.query(model.id).filter(
+        model.id > start).order_by(model.id)]
+
+
+def reset():
+    for table in reversed(db.metadata.sorted_tables):
+        db.session.execute(table.delete())
+    db.session.commit()
+
+
+def analyze():
+    """Refresh planner statistics (and flush GIN pending lists) on PG."""
+    if db.engine.dialect.name == 'postgresql':
+        with db.engine.connect().execution_options(
+                isolation_level='AUTOCOMMIT') as connection:
+            connection.execute(text('VACUUM ANALYZE'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scale', choices=sorted(SCALES), default='1k')
+    parser.add_argument('--venues', type=int,
+                        help="Override the scale's venue count.")
+    parser.add_argument('--artists', type=int,
+                        help="Override the scale's artist count.")
+    parser.add_argument('--shows', type=int,
+                        help="Override the scale's show count.")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--batch-size', type=int, default=10000)
+    parser.add_argument('--reset', action='store_true',
+                        help='Delete all existing rows first.')
+    args = parser.parse_args()
+
+    n_venues, n_artists, n_shows = SCALES[args.scale]
+    n_venues = args.venues or n_venues
+    n_artists = args.artists or n_artists
+    n_shows = args.shows if args.shows is not None else n_shows
+    if n_venues > n_artists:
+        parser.error('need at least as many artists as venues')
+
+    rng = random.Random(args.seed)
+    n_cities = max(1, n_venues // VENUES_PER_CITY)
+    started = time.time()
+    init_db()
+    if args.reset:
+        reset()
+    venue_ids = insert_entities(
+        Venue, venue_rows(rng, n_venues, n_cities), args.batch_size)
+    artist_ids = insert_entities(
+        Artist, artist_rows(rng, n_artists, n_cities), args.batch_size)
+    insert(Show, show_rows(rng, n_shows, venue_ids, artist_ids,
+                           datetime.now()), args.batch_size)
+    counters.sweep()
+    analyze()
+    print('Seeded {} venues, {} artists and {} shows in {:.1f}s.'.format(
+        n_venues, n_artists, n_shows, time.time() - started))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+"""Booking conflict detection.
+
+A show holds its venue and its artist for SHOW_DURATION_MINUTES from its
+start time. Two shows conflict when they share a venue or an artist and
+start less than one slot apart. For fixed-length slots that is a plain
+range condition on ``start_time``, answered by the (venue_id, start_time)
+and (artist_id, start_time) indexes.
+
+On PostgreSQL the booking conflicts migration also adds GiST exclusion
+constraints over ``tsrange(start_time, start_time + slot)``. Two
+concurrent bookings therefore can't both commit. ``check_availability()``
+answers many candidate slots from one query and an in-memory index of
+sorted start times.
+"""
+from bisect import bisect_right
+from datetime import timedelta
+
+from flask import current_app
+from sqlalchemy import and_, or_
+
+from models import db, Show
+
+
+def slot_length():
+    return timedelta(minutes=current_app.config['SHOW_DURATION_MINUTES'])
+
+
+def naive_local(start_time):
+    """``start_time`` as the naive local time shows are stored in."""
+    if start_time.tzinfo is None:
+        return start_time
+    return start_time.astimezone().replace(tzinfo=None)
+
+
+def find_conflicts(venue_id, artist_id, start_time, exclude_id=None):
+    """Shows that overlap a booking of ``artist_id`` at ``venue_id``."""
+    venue_id, artist_id = int(venue_id), int(artist_id)
+    length = slot_length()
+    overlaps = and_(Show.start_time > start_time - length,
+                    Show.start_time < start_time + length)
+    query = Show.query.filter(or_(
+        and_(Show.venue_id == venue_id, overlaps),
+        and_(Show.artist_id == artist_id, overlaps)))
+    if exclude_id is not None:
+        query = query.filter(Show.id != exclude_id)
+    return query.order_by(Show.start_time).all()
+
+
+class SlotIndex(object):
+    """Sorted start times per key; finds overlapping slots by bisection."""
+
+    def __init__(self, length):
+        self.length = length
+        self._starts = {}
+
+    def add(self, key, start_time, ref):
+        entries = self._starts.setdefault(key, [])
+        entries.insert(bisect_right(entries, (start_time,)), (start_time, ref))
+
+    def overlapping(self, key, start_time):
+        entries = self._starts.get(key, [])
+        i = bisect_right(entries, (start_time - self.length, ))
+        found = []
+        while i < len(entries) and \
+                entries[i][0] < start_time + self.length:
+            if entries[i][0] > start_time - self.length:
+                found.append(entries[i][1])
+            i += 1
+        return found
+
+
+def booked_slots(slots):
+    """SlotIndex of the booked shows that could overlap any of ``slots``.
+
+    Keys are ``('venue', venue_id)`` and ``('artist', artist_id)``; the refs
+    are show ids. Costs one query.
+    """
+    length = slot_length()
+    booked = SlotIndex(length)
+    if not slots:
+        return booked
+    venue_ids = {slot['venue_id'] for slot in slots}
+    artist_ids = {slot['artist_id'] for slot in slots}
+    earliest = min(slot['start_time'] for slot in slots) - length
+    latest = max(slot['start_time'] for slot in slots) + length
+    for show_id, venue_id, artist_id, start_time in db.session.query(
+            Show.id, Show.venue_id, Show.artist_id, Show.start_time).filter(
+            or_(Show.venue_id.in_(venue_ids),
+                Show.artist_id.in_(artist_ids)),
+            Show.start_time > earliest, Show.start_time < latest):
+        booked.add(('venue', venue_id), start_time, show_id)
+        booked.add(('artist', artist_id), start_time, show_id)
+    return booked
+
+
+def slot_keys(slot):
+    return (('venue', slot['venue_id']), ('artist', slot['artist_id']))
+
+
+def check_availability(slots):
+    """Check many ``{venue_id, artist_id, start_time}`` slots at once.
+
+    Returns one ``{"available", "conflicts", "conflicting_slots"}`` dict
+    per slot. ``conflicts`` lists the ids of booked shows. Slots are also
+    checked against earlier slots in the same batch; ``conflicting_slots``
+    holds their positions.
+    """
+    if not slots:
+        return []
+    booked = booked_slots(slots)
+    requested = SlotIndex(booked.length)
+
+    results = []
+    for position, slot in enumerate(slots):
+        keys = slot_keys(slot)
+        conflicts = sorted({show_id for key in keys for show_id in
+                            booked.overlapping(key, slot['start_time'])})
+        conflicting_slots = sorted({other for key in keys for other in
+                                    requested.overlapping(
+                                        key, slot['start_time'])})
+        for key in keys:
+            requested.add(key, slot['start_time'], position)
+        results.append({
+            "available": not conflicts and not conflicting_slots,
+            "conflicts": conflicts,
+            "conflicting_slots": conflicting_slots,
+        })
+    return results
@@ -0,0 +1,327 @@
+"""Streaming bulk import of venues, artists and shows.
+
+    flask import venues venues.csv
+    flask import shows shows.jsonl --batch-size 5000 --errors rejected.jsonl
+
+Files are read one row at a time, as CSV with a header row or as JSON
+lines. The format is picked from the file extension unless ``--format`` is
+given. Every row is validated with the same WTForms form the create pages
+use. Shows must also reference an existing venue and artist and must not
+overlap a booked show or an earlier row (see booking.py). Valid rows are
+inserted in batches: PostgreSQL uses ``COPY``, and other databases use an
+executemany ``INSERT``. Each batch is committed on its own. A batch the
+database rejects, e.g. by the booking exclusion constraints, is retried row
+by row, so only the offending rows are lost. Rejected rows are reported with
+their line number, and progress is printed after every batch.
+
+In CSV files, ``genres`` is a comma separated list inside one field. Rows go
+through Core inserts, not the ORM, so the upcoming show counters are updated
+per batch here, and the search and matchmaking indexes and genre facet
+counts are refreshed after the import. Cached detail pages pick up imported
+shows once their DETAIL_CACHE_TTL expires.
+"""
+import csv
+import io
+import json
+import sys
+import time
+from datetime import datetime
+
+import click
+from sqlalchemy.exc import IntegrityError
+from werkzeug.datastructures import MultiDict
+
+import booking
+import counters
+import genres
+import matchmaking
+import search
+from forms import VenueForm, ArtistForm, ShowForm
+from models import app, db, Venue, Artist, Show
+
+ENTITIES = {
+    'venues': (Venue, VenueForm),
+    'artists': (Artist, ArtistForm),
+    'shows': (Show, ShowForm),
+}
+
+
+class RowError(ValueError):
+    pass
+
+
+# ----------------------------------------------------------------------------#
+# Reading and validation.
+# ----------------------------------------------------------------------------#
+
+def read_rows(stream, fmt):
+    """Yield ``(line number, dict)`` without loading the whole file."""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            if 'genres' in row:
+                row['genres'] = [genre.strip() for genre in
+                                 (row['genres'] or '').split(',')
+                                 if genre.strip()]
+            yield reader.line_num, row
+    else:
+        for line_num, line in enumerate(stream, 1):
+            if line.strip():
+                try:
+                    row = json.loads(line)
+                except ValueError as e:
+                    yield line_num, RowError('invalid JSON: {}'.format(e))
+                    continue
+                if isinstance(row, dict):
+                    yield line_num, row
+                else:
+                    yield line_num, RowError('expected a JSON object')
+
+
+def to_formdata(row):
+    formdata = MultiDict()
+    for key, value in row.items():
+        if isinstance(value, list):
+            formdata.setlist(key, [str(item) for item in value])
+        elif isinstance(value, bool):
+            # BooleanField treats any non-empty string as checked.
+            if value:
+                formdata.add(key, 'y')
+        elif value is not None:
+            formdata.add(key, str(value))
+    return formdata
+
+
+def validate(model, form_class, row):
+    """Return the insertable column mapping for ``row`` or raise RowError."""
+    if isinstance(row, RowError):
+        raise row
+    form = form_class(formdata=to_formdata(row), meta={'csrf': False})
+    if not form.validate():
+        raise RowError('; '.join(
+            field + ' ' + '|'.join(errors)
+            for field, errors in form.errors.items()))
+    columns = model.__table__.columns
+    values = {key: value for key, value in form.data.items()
+              if key in columns and key != 'id'}
+    if model is Show:
+        try:
+            values['venue_id'] = int(values['venue_id'])
+            values['artist_id'] = int(values['artist_id'])
+        except (TypeError, ValueError):
+            raise RowError('venue_id and artist_id must be integers')
+    return values
+
+
+def check_references(batch):
+    """Split a show batch into rows whose venue and artist exist, and errors.
+
+    Costs one query per referenced table per batch.
+    """
+    venue_ids = {values['venue_id'] for _, values in batch}
+    artist_ids = {values['artist_id'] for _, values in batch}
+    known_venues = {venue_id for venue_id, in db.session.query(
+        Venue.id).filter(Venue.id.in_(venue_ids))}
+    known_artists = {artist_id for artist_id, in db.session.query(
+        Artist.id).filter(Artist.id.in_(artist_ids))}
+    valid, errors = [], []
+    for line_num, values in batch:
+        if values['venue_id'] not in known_venues:
+            errors.append((line_num, 'unknown venue_id {}'.format(
+                values['venue_id'])))
+        elif values['artist_id'] not in known_artists:
+            errors.append((line_num, 'unknown artist_id {}'.format(
+                values['artist_id'])))
+        else:
+            valid.append((line_num, values))
+    return valid, errors
+
+
+def check_conflicts(batch):
+    """Split a show batch into rows that fit the bookings, and errors.
+
+    A row conflicts with a booked show or with an earlier accepted row of
+    the batch. Costs one query per batch.
+    """
+    booked = booking.booked_slots([values for _, values in batch])
+    accepted = booking.SlotIndex(booked.length)
+    valid, errors = [], []
+    for line_num, values in batch:
+        keys = booking.slot_keys(values)
+        shows = sorted({show_id for key in keys for show_id in
+                        booked.overlapping(key, values['start_time'])})
+        lines = sorted({other for key in keys for other in
+                        accepted.overlapping(key, values['start_time'])})
+        if shows:
+            errors.append((line_num, 'overlaps booked show {}'.format(
+                ', '.join(str(show_id) for show_id in shows))))
+        elif lines:
+            errors.append((line_num, 'overlaps line {}'.format(
+                ', '.join(str(other) for other in lines))))
+        else:
+            for key in keys:
+                accepted.add(key, values['start_time'], line_num)
+            valid.append((line_num, values))
+    return valid, errors
+
+
+# ----------------------------------------------------------------------------#
+# Inserting.
+# ----------------------------------------------------------------------------#
+
+def _copy_value(value):
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, datetime):
+        return value.isoformat(' ')
+    if isinstance(value, list):
+        return '{' + ','.join(
+            '"' + str(item).replace('\\', '\\\\').replace('"', '\\"') + '"'
+            for item in value) + '}'
+    return value
+
+
+def copy_rows(connection, table, rows):
+    """Load ``rows`` with PostgreSQL COPY over the session's connection."""
+    names = list(rows[0])
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([_copy_value(row[name]) for name in names])
+    buffer.seek(0)
+    statement = ("COPY {} ({}) FROM STDIN "
+                 "WITH (FORMAT csv, NULL '\\N')").format(
+        table.name, ', '.join(names))
+    cursor = connection.connection.cursor()
+    try:
+        cursor.copy_expert(statement, buffer)
+    except connection.dialect.dbapi.IntegrityError as e:
+        # Raw DBAPI cursor; raise what the ORM path would.
+        raise IntegrityError(statement, None, e) from e
+    finally:
+        cursor.close()
+
+
+def insert_batch(model, rows):
+    connection = db.session.connection()
+    if connection.dialect.name == 'postgresql':
+        copy_rows(connection, model.__table__, rows)
+    else:
+        connection.execute(model.__table__.insert(), rows)
+
+    if model is Show:
+        since = counters.watermark(connection)
+        venue_deltas, artist_deltas = {}, {}
+        for row in rows:
+            if row['start_time'] > since:
+                venue_deltas[row['venue_id']] = \
+                    venue_deltas.get(row['venue_id'], 0) + 1
+                artist_deltas[row['artist_id']] = \
+                    artist_deltas.get(row['artist_id'], 0) + 1
+        counters.adjust(connection, Venue, venue_deltas)
+        counters.adjust(connection, Artist, artist_deltas)
+    db.session.commit()
+
+
+def import_rows(entity, rows, batch_size, on_progress=None, on_error=None):
+    """Validate and insert ``(line number, row)`` pairs in batches.
+
+    Returns ``(inserted, rejected)``.
+    """
+    model, form_class = ENTITIES[entity]
+    inserted = rejected = 0
+    batch = []
+
+    def reject(line_num, message):
+        nonlocal rejected
+        rejected += 1
+        if on_error:
+            on_error(line_num, message)
+
+    def flush():
+        nonlocal inserted
+        valid = batch
+        if model is Show:
+            valid, errors = check_references(valid)
+            valid, conflicts = check_conflicts(valid)
+            for line_num, message in sorted(errors + conflicts):
+                reject(line_num, message)
+        if valid:
+            try:
+                insert_batch(model, [values for _, values in valid])
+                inserted += len(valid)
+            except IntegrityError:
+                # e.g. a show booked concurrently; find the offending rows.
+                db.session.rollback()
+                for line_num, values in valid:
+                    try:
+                        insert_batch(model, [values])
+                        inserted += 1
+                    except IntegrityError as e:
+                        db.session.rollback()
+                        reject(line_num, 'rejected by the database: '
+                               + str(e.orig).strip().splitlines()[0])
+        del batch[:]
+        if on_progress:
+            on_progress(inserted, rejected)
+
+    for line_num, row in rows:
+        try:
+            batch.append((line_num, validate(model, form_class, row)))
+        except RowError as e:
+            reject(line_num, str(e))
+        if len(batch) >= batch_size:
+            flush()
+    flush()
+
+    if model in (Venue, Artist):
+        search.mark_stale(model)
+        matchmaking.mark_stale(model)
+        genres.invalidate()
+    return inserted, rejected
+
+
+@app.cli.command('import')
+@click.argument('entity', type=click.Choice(sorted(ENTITIES)))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False,
+                                        allow_dash=True))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']),
+              help='Input format; defaults to the file extension.')
+@click.option('--batch-size', default=1000, show_default=True,
+              help='Rows per insert and commit.')
+@click.option('--errors', 'errors_path', type=click.Path(dir_okay=False),
+              help='Write rejected rows here as JSON lines '
+                   '(default: stderr).')
+def import_command(entity, path, fmt, batch_size, errors_path):
+    """Bulk import ENTITY rows from a CSV or JSON lines file."""
+    fmt = fmt or ('csv' if path.endswith('.csv') else 'jsonl')
+    started = time.time()
+    errors_out = open(errors_path, 'w') if errors_path else sys.stderr
+
+    def on_error(line_num, message):
+        errors_out.write(json.dumps({'line': line_num,
+                                     'error': message}) + '\n')
+
+    def on_progress(inserted, rejected):
+        elapsed = time.time() - started
+        click.echo('{}: {} inserted, {} rejected ({:.0f} rows/s)'.format(
+            entity, inserted, rejected,
+            (inserted + rejected) / elapsed if elapsed else 0))
+
+    stream = None
+    try:
+        stream = sys.stdin if path == '-' else \
+            open(path, newline='', encoding='utf-8')
+        inserted, rejected = import_rows(
+            entity, read_rows(stream, fmt), batch_size,
+            on_progress=on_progress, on_error=on_error)
+    finally:
+        # Only close what this command opened, not stdin.
+        if stream not in (None, sys.stdin):
+            stream.close()
+        if errors_path:
+            errors_out.close()
+    click.echo('Done: {} inserted, {} rejected in {:.1f}s.'.format(
+        inserted, rejected, time.time() - started))
@@ -0,0 +1,193 @@
+"""Read-through cache for venue and artist detail view models.
+
+Entries are keyed by ``kind:id`` and expire after a TTL. The least recently
+used entry is evicted once the cache holds ``max_entries``. Two backends
+are available:
+
+* ``memory`` -- an in-process ordered dict, for a single worker.
+* ``sqlite`` -- a SQLite file on local disk shared by all gunicorn workers
+  on the host, so an invalidation in one worker is seen by the others.
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class MemoryBackend(object):
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return ``(found, value)``."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            expires_at, value = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                return False, None
+            self._entries.move_to_end(key)
+            return True, value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteBackend(object):
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS cache (
+            key TEXT PRIMARY KEY,
+            value BLOB NOT NULL,
+            expires_at REAL NOT NULL,
+            accessed_at REAL NOT NULL
+        )
+    '''
+
+    def __init__(self, path, max_entries, ttl):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.execute(self.SCHEMA)
+            conn.execute('CREATE INDEX IF NOT EXISTS ix_cache_accessed_at '
+                         'ON cache (accessed_at)')
+
+    def _connection(self):
+        # sqlite3 connections can't be shared across threads; keep one per
+        # thread (and per process, since workers fork after import).
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5,
+                                   isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key):
+        conn = self._connection()
+        now = time.time()
+        row = conn.execute('SELECT value, expires_at FROM cache WHERE key = ?',
+                           (key,)).fetchone()
+        if row is None:
+            return False, None
+        if row[1] <= now:
+            conn.execute('DELETE FROM cache WHERE key = ?', (key,))
+            return False, None
+        conn.execute('UPDATE cache SET accessed_at = ? WHERE key = ?',
+                     (now, key))
+        return True, pickle.loads(row[0])
+
+    def set(self, key, value):
+        conn = self._connection()
+        now = time.time()
+        conn.execute('INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?)',
+                     (key, pickle.dumps(value), now + self.ttl, now))
+        conn.execute('''
+            DELETE FROM cache WHERE key IN (
+                SELECT key FROM cache ORDER BY accessed_at DESC
+                LIMIT -1 OFFSET ?)''', (self.max_entries,))
+
+    def delete(self, *keys):
+        if keys:
+            self._connection().executemany('DELETE FROM cache WHERE key = ?',
+                                           [(key,) for key in keys])
+
+    def clear(self):
+        self._connection().execute('DELETE FROM cache')
+
+    def __len__(self):
+        return self._connection().execute(
+            'SELECT count(*) FROM cache').fetchone()[0]
+
+
+class EntityCache(object):
+    """Read-through cache with hit/miss counters.
+
+    Counters are per process; ``stats()`` reports them together with the
+    backend's current size.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(kind, entity_id):
+        return '{}:{}'.format(kind, entity_id)
+
+    def get_or_load(self, kind, entity_id, loader):
+        """Return the cached value, calling ``loader(entity_id)`` on a miss.
+
+        ``None`` results (unknown ids) are not cached.
+        """
+        key = self.key(kind, entity_id)
+        found, value = self.backend.get(key)
+        with self._lock:
+            if found:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if found:
+            return value
+        value = loader(entity_id)
+        if value is not None:
+            self.backend.set(key, value)
+        return value
+
+    def invalidate(self, kind, *entity_ids):
+        self.backend.delete(*[self.key(kind, entity_id)
+                              for entity_id in entity_ids])
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__,
+            "entries": len(self.backend),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else None,
+        }
+
+
+def make_cache(config):
+    """Build an ``EntityCache`` from the ``DETAIL_CACHE_*`` settings."""
+    ttl = config['DETAIL_CACHE_TTL']
+    max_entries = config['DETAIL_CACHE_MAX_ENTRIES']
+    backend = config['DETAIL_CACHE_BACKEND']
+    if backend == 'memory':
+        return EntityCache(MemoryBackend(max_entries, ttl))
+    if backend == 'sqlite':
+        return EntityCache(SQLiteBackend(config['DETAIL_CACHE_PATH'],
+                                         max_entries, ttl))
+    raise ValueError('Unknown DETAIL_CACHE_BACKEND: {!r}'.format(backend))
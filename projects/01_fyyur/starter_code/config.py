@@ -10,6 +10,74 @@ DEBUG = True
 
 
 # TODO IMPLEMENT DATABASE URL
-SQLALCHEMY_DATABASE_URI = 'postgres://neethajain@localhost:5432/fyyur'
+SQLALCHEMY_DATABASE_URI = os.environ.get(
+    'DATABASE_URL', 'postgresql://neethajain@localhost:5432/fyyur')
+
+# Set FYYUR_SQLITE to run against SQLite instead, with no database server:
+# ':memory:' for a private in-memory database (tests), or a file path (CI and
+# benchmark machines). Create the tables with ``flask init-db``.
+SQLITE_DATABASE = os.environ.get('FYYUR_SQLITE')
+if SQLITE_DATABASE == ':memory:':
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+elif SQLITE_DATABASE:
+    SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.abspath(SQLITE_DATABASE)
 SQLALCHEMY_TRACK_MODIFICATIONS = False
 #SQLALCHEMY_ECHO = True
+
+
+def _env_int(name, default=None):
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+
+# Connection pool: a profile from pooling.PROFILES ('dev', 'gunicorn-sync',
+# 'gevent'), with optional per-setting overrides. models.py turns these
+# into SQLALCHEMY_ENGINE_OPTIONS.
+DB_POOL_PROFILE = os.environ.get('DB_POOL_PROFILE', 'dev')
+DB_POOL_SIZE = _env_int('DB_POOL_SIZE')
+DB_MAX_OVERFLOW = _env_int('DB_MAX_OVERFLOW')
+DB_POOL_TIMEOUT = _env_int('DB_POOL_TIMEOUT')
+DB_POOL_RECYCLE = _env_int('DB_POOL_RECYCLE', 1800)
+# PostgreSQL only; 0 disables it. Migrations use their own engine without it.
+DB_STATEMENT_TIMEOUT_MS = _env_int('DB_STATEMENT_TIMEOUT_MS', 15000)
+
+# Application log: JSON lines written off the request thread by a queue
+# listener. Shared by all workers and rotated externally, e.g. by
+# logrotate. See request_logging.py.
+LOG_FILE = os.environ.get('LOG_FILE', os.path.join(basedir, 'fyyur.log'))
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+
+# Listing and search pages are paginated with keyset cursors (see
+# pagination.py); ``per_page`` query arguments are capped at MAX_PER_PAGE.
+SHOWS_PER_PAGE = 30
+VENUES_PER_PAGE = 50
+ARTISTS_PER_PAGE = 50
+SEARCH_RESULT_LIMIT = 50
+
+# Rows fetched per server-side cursor round trip by the /export endpoints.
+EXPORT_BATCH_SIZE = 1000
+
+# Venue/artist detail page cache. Use 'memory' for a single worker, or
+# 'sqlite' to share one cache file between gunicorn workers on a host.
+DETAIL_CACHE_BACKEND = 'memory'
+DETAIL_CACHE_TTL = 300
+DETAIL_CACHE_MAX_ENTRIES = 10000
+DETAIL_CACHE_PATH = os.path.join(basedir, 'detail_cache.db')
+MAX_PER_PAGE = 100
+
+# How long a show holds its venue and artist. Bookings that overlap are
+# rejected; see booking.py. The PostgreSQL exclusion constraints are built
+# from this value by migration e7b3a91f2c58 and must be recreated after a
+# change.
+SHOW_DURATION_MINUTES = 180
+
+# Per-genre counts shown next to the listing and search pages; see genres.py.
+FACET_CACHE_TTL = 60
+FACET_CACHE_MAX_ENTRIES = 1000
+
+# /venues/<id>/recommendations and /artists/<id>/recommendations.
+RECOMMENDATIONS_PER_PAGE = 20
+RECOMMENDATIONS_MAX_AGE = 300
+# Seconds before a worker rebuilds its matchmaking index, to pick up writes
+# committed by other workers.
+MATCHMAKING_INDEX_TTL = 60
@@ -0,0 +1,167 @@
+"""Denormalized upcoming show counters.
+
+``Venue.upcoming_shows_count`` and ``Artist.upcoming_shows_count`` hold the
+number of shows starting after the sweep watermark
+(``ShowCounterSweep.swept_at``), so listing and search pages can read them
+straight off the row.
+
+* Show inserts, deletes and updates adjust the counters in the same
+  transaction (mapper events below).
+* ``flask counters sweep`` should run periodically (cron). It decrements the
+  counters for shows that started since the last sweep and moves the
+  watermark to now. The sweep interval bounds how stale a count can be.
+* ``flask counters check [--repair]`` recounts from ``shows`` and reports,
+  and optionally fixes, any drift.
+"""
+from datetime import datetime
+
+import click
+from sqlalchemy import and_, event, func, select
+from sqlalchemy.orm.attributes import get_history
+
+from models import app, db, Venue, Artist, Show, ShowCounterSweep
+
+COUNTED = ((Show.venue_id, Venue), (Show.artist_id, Artist))
+
+
+def watermark(connection):
+    """Current sweep watermark; ``datetime.min`` before the first sweep."""
+    swept_at = connection.execute(
+        select([ShowCounterSweep.swept_at]).limit(1)).scalar()
+    return swept_at or datetime.min
+
+
+def adjust(connection, model, deltas):
+    """Apply ``{entity_id: delta}`` to ``model.upcoming_shows_count``."""
+    table = model.__table__
+    for entity_id, delta in deltas.items():
+        if delta:
+            connection.execute(table.update().where(
+                table.c.id == entity_id).values(
+                upcoming_shows_count=table.c.upcoming_shows_count + delta))
+
+
+# ----------------------------------------------------------------------------#
+# Incremental maintenance.
+# ----------------------------------------------------------------------------#
+
+def _show_deltas(venue_id, artist_id, start_time, since, delta):
+    if start_time is None or start_time <= since:
+        return {}
+    return {Venue: {venue_id: delta}, Artist: {artist_id: delta}}
+
+
+def _apply(connection, *changes):
+    for model in (Venue, Artist):
+        deltas = {}
+        for change in changes:
+            for entity_id, delta in change.get(model, {}).items():
+                deltas[entity_id] = deltas.get(entity_id, 0) + delta
+        adjust(connection, model, deltas)
+
+
+@event.listens_for(Show, 'after_insert')
+def _show_inserted(mapper, connection, target):
+    _apply(connection, _show_deltas(target.venue_id, target.artist_id,
+                                    target.start_time,
+                                    watermark(connection), 1))
+
+
+@event.listens_for(Show, 'after_delete')
+def _show_deleted(mapper, connection, target):
+    _apply(connection, _show_deltas(target.venue_id, target.artist_id,
+                                    target.start_time,
+                                    watermark(connection), -1))
+
+
+@event.listens_for(Show, 'after_update')
+def _show_updated(mapper, connection, target):
+    old = {}
+    for attr in ('venue_id', 'artist_id', 'start_time'):
+        history = get_history(target, attr)
+        old[attr] = history.deleted[0] if history.deleted \
+            else getattr(target, attr)
+    if old == {'venue_id': target.venue_id, 'artist_id': target.artist_id,
+               'start_time': target.start_time}:
+        return
+    since = watermark(connection)
+    _apply(connection,
+           _show_deltas(old['venue_id'], old['artist_id'],
+                        old['start_time'], since, -1),
+           _show_deltas(target.venue_id, target.artist_id,
+                        target.start_time, since, 1))
+
+
+# ----------------------------------------------------------------------------#
+# Sweep and consistency check.
+# ----------------------------------------------------------------------------#
+
+def sweep(now=None):
+    """Retire shows that started since the last sweep; returns their count."""
+    now = now or datetime.now()
+    marker = ShowCounterSweep.query.with_for_update().first()
+    since = marker.swept_at if marker else datetime.min
+    started = and_(Show.start_time > since, Show.start_time <= now)
+
+    retired = Show.query.filter(started).count()
+    for key, model in COUNTED:
+        started_counts = db.session.query(key, func.count(Show.id)).filter(
+            started).group_by(key)
+        adjust(db.session.connection(), model,
+               {entity_id: -count for entity_id, count in started_counts})
+
+    if marker is None:
+        db.session.add(ShowCounterSweep(swept_at=now))
+    else:
+        marker.swept_at = now
+    db.session.commit()
+    return retired
+
+
+def check(repair=False):
+    """Return ``[(model name, id, stored, expected)]`` for drifted rows."""
+    since = watermark(db.session.connection())
+    drift = []
+    for key, model in COUNTED:
+        expected = Show.upcoming_counts(key, since)
+        rows = db.session.query(
+            model.id, model.upcoming_shows_count,
+            func.coalesce(expected.c.num_upcoming_shows, 0)).outerjoin(
+            expected, expected.c.id == model.id).filter(
+            model.upcoming_shows_count != func.coalesce(
+                expected.c.num_upcoming_shows, 0)).all()
+        for entity_id, stored, actual in rows:
+            drift.append((model.__name__, entity_id, stored, actual))
+            if repair:
+                adjust(db.session.connection(), model,
+                       {entity_id: actual - stored})
+    if repair:
+        db.session.commit()
+    return drift
+
+
+@app.cli.group()
+def counters():
+    """Maintain the denormalized upcoming show counters."""
+
+
+@counters.command('sweep')
+def sweep_command():
+    """Decrement counters for shows that have started since the last run."""
+    click.echo('Retired {} started shows.'.format(sweep()))
+
+
+@counters.command('check')
+@click.option('--repair', is_flag=True, help='Rewrite drifted counters.')
+def check_command(repair):
+    """Compare the counters with a recount of the shows table."""
+    drift = check(repair=repair)
+    for name, entity_id, stored, actual in drift:
+        click.echo('{} {}: stored {}, expected {}'.format(
+            name, entity_id, stored, actual))
+    if not drift:
+        click.echo('Counters are consistent.')
+    elif repair:
+        click.echo('Repaired {} counters.'.format(len(drift)))
+    else:
+        raise SystemExit(1)
@@ -0,0 +1,100 @@
+"""Streaming data exports.
+
+    GET /export/venues.ndjson    GET /export/venues.csv
+    GET /export/artists.ndjson   GET /export/artists.csv
+    GET /export/shows.ndjson     GET /export/shows.csv
+
+Rows are read with a server-side cursor (``yield_per``) and written out a
+batch at a time through a generator response. Memory use stays flat however
+big the table is, and the first bytes go out as soon as the first batch is
+read. CSV output uses the same layout ``flask import`` reads (genres are a
+comma separated field), so a dump can be re-imported.
+"""
+import csv
+import io
+import json
+from datetime import datetime
+
+from flask import Response, abort, stream_with_context
+
+from models import app, db, Venue, Artist, Show
+
+EXPORT_COLUMNS = {
+    'venues': (Venue, ('id', 'name', 'city', 'state', 'address', 'phone',
+                       'genres', 'image_link', 'facebook_link',
+                       'website_link', 'seeking_talent',
+                       'seeking_description')),
+    'artists': (Artist, ('id', 'name', 'city', 'state', 'phone', 'genres',
+                         'image_link', 'facebook_link', 'website_link',
+                         'seeking_venue', 'seeking_description')),
+    'shows': (Show, ('id', 'name', 'venue_id', 'artist_id', 'start_time')),
+}
+
+MIMETYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(repr(value))
+
+
+def _csv_value(value):
+    if isinstance(value, list):
+        return ','.join(value)
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    return value
+
+
+def stream_rows(model, names, batch_size):
+    """Yield lists of row tuples, ``batch_size`` rows at a time."""
+    query = db.session.query(*[getattr(model, name) for name in names]) \
+        .order_by(model.id) \
+        .execution_options(stream_results=True) \
+        .yield_per(batch_size)
+    batch = []
+    for row in query:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def generate_ndjson(model, names, batch_size):
+    for batch in stream_rows(model, names, batch_size):
+        yield ''.join(json.dumps(dict(zip(names, row)),
+                                 default=_json_default) + '\n'
+                      for row in batch)
+
+
+def generate_csv(model, names, batch_size):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(names)
+    for batch in stream_rows(model, names, batch_size):
+        writer.writerows([_csv_value(value) for value in row]
+                         for row in batch)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+@app.route('/export/<entity>.<fmt>')
+def export(entity, fmt):
+    if entity not in EXPORT_COLUMNS or fmt not in MIMETYPES:
+        abort(404)
+    model, names = EXPORT_COLUMNS[entity]
+    generate = generate_ndjson if fmt == 'ndjson' else generate_csv
+    rows = generate(model, names, app.config['EXPORT_BATCH_SIZE'])
+    return Response(stream_with_context(rows), mimetype=MIMETYPES[fmt],
+                    headers={'Content-Disposition':
+                             'attachment; filename={}.{}'.format(entity,
+                                                                 fmt)})
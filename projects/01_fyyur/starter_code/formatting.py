@@ -0,0 +1,45 @@
+"""Date formatting for templates.
+
+Views hand ``datetime`` objects straight to the ``datetime`` Jinja filter.
+Babel patterns are compiled once per (format, locale) and reused.
+Strings are still accepted, and parsed, for older callers. babel and
+dateutil are imported on first use rather than when a worker starts.
+"""
+from datetime import datetime
+from functools import lru_cache
+
+FORMATS = {
+    'full': "EEEE MMMM, d, y 'at' h:mma",
+    'medium': "EE MM, dd, y h:mma",
+}
+
+
+@lru_cache(maxsize=64)
+def compiled_pattern(format, locale):
+    """Return the parsed babel pattern and ``Locale`` for a format name.
+
+    ``format`` is a key of ``FORMATS`` or a raw CLDR pattern.
+    """
+    import babel.dates
+    from babel import Locale
+    pattern = FORMATS.get(format, format)
+    return babel.dates.parse_pattern(pattern), Locale.parse(locale)
+
+
+def _as_datetime(value):
+    if isinstance(value, datetime):
+        return value
+    import dateutil.parser
+    return dateutil.parser.parse(value)
+
+
+def format_datetime(value, format='medium', locale='en'):
+    pattern, babel_locale = compiled_pattern(format, locale)
+    return pattern.apply(_as_datetime(value), babel_locale)
+
+
+def format_datetimes(values, format='medium', locale='en'):
+    """Format a whole list with one pattern lookup."""
+    pattern, babel_locale = compiled_pattern(format, locale)
+    return [pattern.apply(_as_datetime(value), babel_locale)
+            for value in values]
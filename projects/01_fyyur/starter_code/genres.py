@@ -0,0 +1,121 @@
+"""Genre filters and facet counts for venues and artists.
+
+Listing and search pages take ``?genre=Jazz&genre=Folk``. With
+``match=all`` (the default), a row must have every requested genre; this
+is array containment, ``genres @> ARRAY[...]``. With ``match=any``, any one
+genre is enough; this is array overlap, ``genres && ARRAY[...]``. Both
+operators use the GIN indexes on ``genres``. On other databases genres are
+a JSON array (see models.GenreList) and the same filters are answered with
+``json_each()``, without an index.
+
+Facet counts give the number of rows per genre within the current filter.
+They come from one ``unnest(genres) ... GROUP BY`` query. Results are
+cached for FACET_CACHE_TTL seconds, and committed writes to the model
+clear them.
+"""
+from flask import current_app, request
+from sqlalchemy import cast, distinct, event, func, select, true
+from sqlalchemy.orm import Session, object_session
+
+from cache import EntityCache, MemoryBackend
+from models import db, Venue, Artist
+
+MATCH_MODES = ('all', 'any')
+
+_facet_cache = None
+
+
+def requested():
+    """``(genres, match)`` from the current request's arguments."""
+    genres = sorted({genre for genre in request.values.getlist('genre')
+                     if genre})
+    match = request.values.get('match')
+    return genres, match if match in MATCH_MODES else 'all'
+
+
+def _json_genres(model):
+    """``json_each(genres)``: one ``value`` row per genre of a row."""
+    return func.json_each(model.genres).table_valued('value')
+
+
+def genre_filter(model, genres, match='all'):
+    if db.engine.dialect.name != 'postgresql':
+        values = _json_genres(model)
+        found = select(func.count(distinct(values.c.value))).where(
+            values.c.value.in_(genres)).scalar_subquery()
+        return found > 0 if match == 'any' else found == len(set(genres))
+    # The column is an ARRAY only on PostgreSQL, and the generic type has no
+    # contains()/overlap(); cast the list to the column's own type so the
+    # GIN index applies.
+    value = cast(list(genres), model.genres.type)
+    return model.genres.op('&&' if match == 'any' else '@>')(value)
+
+
+def facet_cache():
+    global _facet_cache
+    if _facet_cache is None:
+        _facet_cache = EntityCache(MemoryBackend(
+            current_app.config['FACET_CACHE_MAX_ENTRIES'],
+            current_app.config['FACET_CACHE_TTL']))
+    return _facet_cache
+
+
+def _load_facets(model, genres, match):
+    if db.engine.dialect.name == 'postgresql':
+        rows = db.session.query(func.unnest(model.genres).label('genre'))
+    else:
+        values = _json_genres(model)
+        rows = db.session.query(values.c.value.label('genre')).select_from(
+            model).join(values, true())
+    if genres:
+        rows = rows.filter(genre_filter(model, genres, match))
+    rows = rows.subquery()
+    count = func.count().label('count')
+    return [{"genre": genre, "count": total} for genre, total in
+            db.session.query(rows.c.genre, count).group_by(
+                rows.c.genre).order_by(count.desc(), rows.c.genre)]
+
+
+def facet_counts(model, genres=(), match='all'):
+    """``[{"genre", "count"}]`` for rows matching the filter, largest first."""
+    genres = sorted(genres)
+    if db.session.info.get('genre_facets_stale'):
+        # Uncommitted changes in this session; don't cache what they show.
+        return _load_facets(model, genres, match)
+    key = '{}:{}'.format(match, ','.join(genres))
+    return facet_cache().get_or_load(
+        model.__tablename__, key,
+        lambda _: _load_facets(model, genres, match))
+
+
+def invalidate():
+    """Drop all cached facet counts.
+
+    The cache holds only a few small entries, so clearing all of it is
+    simpler than working out which filters a write affected.
+    """
+    if _facet_cache is not None:
+        _facet_cache.clear()
+
+
+# Mapper events fire at flush time, so the write is noted on the session
+# and the counts are dropped once it commits; a rollback forgets it.
+
+def _invalidate(mapper, connection, target):
+    object_session(target).info['genre_facets_stale'] = True
+
+
+def _apply_pending(session):
+    if session.info.pop('genre_facets_stale', False):
+        invalidate()
+
+
+def _discard_pending(session, *args):
+    session.info.pop('genre_facets_stale', None)
+
+
+for _model in (Venue, Artist):
+    for _event in ('after_insert', 'after_update', 'after_delete'):
+        event.listen(_model, _event, _invalidate)
+event.listen(Session, 'after_commit', _apply_pending)
+event.listen(Session, 'after_soft_rollback', _discard_pending)
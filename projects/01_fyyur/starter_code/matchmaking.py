@@ -0,0 +1,263 @@
+"""Venue/artist matchmaking.
+
+    GET /venues/<id>/recommendations?page=1&per_page=20   artists for a venue
+    GET /artists/<id>/recommendations?page=1&per_page=20  venues for an artist
+
+Candidates are the other side's rows that are seeking a booking
+(``seeking_venue`` for artists, ``seeking_talent`` for venues) and share at
+least one genre with the subject. They are ranked by shared genre count,
+plus a bonus for the same state and a larger one for the same city.
+
+Each side keeps an in-process inverted index of genre -> ids, built from
+one query the first time it is needed. After that, each committed insert,
+update or delete in this process changes one entry. A lookup touches only
+the postings for the subject's genres, and serving a page runs no queries.
+Bulk imports go through Core and mark the index stale, so it is rebuilt on
+next use. Writes committed by other worker processes are picked up when the
+index is rebuilt after MATCHMAKING_INDEX_TTL seconds.
+
+Responses carry a Cache-Control max-age and an ETag hashed from the response
+body, so workers whose indexes differ never share an ETag for different
+content.
+"""
+import threading
+import time
+from collections import namedtuple
+
+from flask import abort, jsonify, request
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from models import app, db, Venue, Artist
+
+CITY_BONUS = 0.5
+STATE_BONUS = 0.25
+
+Entry = namedtuple('Entry', 'name city state genres seeking')
+
+SEEKING_COLUMNS = {Venue: 'seeking_talent', Artist: 'seeking_venue'}
+
+
+def _is_seeking(value):
+    # The seeking_* columns are strings; forms write booleans into them.
+    return str(value).lower() in ('true', 't', 'y', 'yes', '1')
+
+
+def _entry(name, city, state, genres, seeking):
+    return Entry(name, city, state, frozenset(genres or ()),
+                 _is_seeking(seeking))
+
+
+class MatchIndex(object):
+    """Entries by id plus genre -> ids postings for one model."""
+
+    def __init__(self):
+        self.entries = {}
+        self.by_genre = {}
+        self.built_at = time.time()
+
+    def build(self, rows):
+        """(Re)build from ``(id, name, city, state, genres, seeking)`` rows."""
+        self.entries = {}
+        self.by_genre = {}
+        for row in rows:
+            self.put(row[0], _entry(*row[1:]))
+
+    def put(self, entity_id, entry):
+        self.remove(entity_id)
+        self.entries[entity_id] = entry
+        for genre in entry.genres:
+            self.by_genre.setdefault(genre, set()).add(entity_id)
+
+    def remove(self, entity_id):
+        entry = self.entries.pop(entity_id, None)
+        if entry is None:
+            return
+        for genre in entry.genres:
+            ids = self.by_genre.get(genre)
+            if ids is not None:
+                ids.discard(entity_id)
+                if not ids:
+                    del self.by_genre[genre]
+
+    def candidates(self, genres):
+        ids = set()
+        for genre in genres:
+            ids |= self.by_genre.get(genre, set())
+        return ids
+
+
+_indexes = {}
+_stale = set()
+_lock = threading.RLock()
+# One rebuild per model at a time, and the changes committed during it.
+_build_locks = {Venue: threading.Lock(), Artist: threading.Lock()}
+_replay = {}
+
+
+def mark_stale(model):
+    """Rebuild ``model``'s index on its next lookup."""
+    with _lock:
+        _stale.add(model)
+
+
+def _expired(model, index):
+    return index is None or model in _stale or time.time() - \
+        index.built_at >= app.config['MATCHMAKING_INDEX_TTL']
+
+
+def _apply(index, entity_id, entry):
+    if entry is None:
+        index.remove(entity_id)
+    else:
+        index.put(entity_id, entry)
+
+
+def _index(model):
+    """``model``'s index, rebuilt when stale or expired.
+
+    The rebuild runs outside ``_lock``. One request rebuilds while the
+    others keep using the old index; only the first build makes them wait.
+    Changes committed during the rebuild are replayed onto the new index
+    before it is swapped in.
+    """
+    with _lock:
+        index = _indexes.get(model)
+        if not _expired(model, index):
+            return index
+    build_lock = _build_locks[model]
+    if not build_lock.acquire(blocking=index is None):
+        return index
+    try:
+        with _lock:
+            index = _indexes.get(model)
+            if not _expired(model, index):
+                return index
+            _stale.discard(model)
+            _replay[model] = []
+        try:
+            index = MatchIndex()
+            index.build(db.session.query(
+                model.id, model.name, model.city, model.state, model.genres,
+                getattr(model, SEEKING_COLUMNS[model])).all())
+        finally:
+            with _lock:
+                changes = _replay.pop(model)
+        with _lock:
+            for entity_id, entry in changes:
+                _apply(index, entity_id, entry)
+            _indexes[model] = index
+        return index
+    finally:
+        build_lock.release()
+
+
+# Mapper events fire at flush time, so changes are queued on the session
+# and applied once it commits; a rollback discards them.
+
+def _pending(target):
+    return object_session(target).info.setdefault('matchmaking', [])
+
+
+def _update_entry(mapper, connection, target):
+    model = type(target)
+    _pending(target).append((model, target.id, _entry(
+        target.name, target.city, target.state, target.genres,
+        getattr(target, SEEKING_COLUMNS[model]))))
+
+
+def _remove_entry(mapper, connection, target):
+    _pending(target).append((type(target), target.id, None))
+
+
+def _apply_pending(session):
+    changes = session.info.pop('matchmaking', None)
+    if not changes:
+        return
+    with _lock:
+        for model, entity_id, entry in changes:
+            if model in _replay:
+                _replay[model].append((entity_id, entry))
+            index = _indexes.get(model)
+            if index is not None:
+                _apply(index, entity_id, entry)
+
+
+def _discard_pending(session, *args):
+    session.info.pop('matchmaking', None)
+
+
+for _model in (Venue, Artist):
+    event.listen(_model, 'after_insert', _update_entry)
+    event.listen(_model, 'after_update', _update_entry)
+    event.listen(_model, 'after_delete', _remove_entry)
+event.listen(Session, 'after_commit', _apply_pending)
+event.listen(Session, 'after_soft_rollback', _discard_pending)
+
+
+def recommend(model, entity_id, other, page=1, per_page=20):
+    """Rank ``other`` rows for ``model`` row ``entity_id``.
+
+    Returns ``(total, results)`` for the requested page, or ``None`` if
+    ``entity_id`` doesn't exist.
+    """
+    subject_index, index = _index(model), _index(other)
+    with _lock:
+        subject = subject_index.entries.get(entity_id)
+        if subject is None:
+            return None
+        ranked = []
+        for candidate_id in index.candidates(subject.genres):
+            candidate = index.entries[candidate_id]
+            if not candidate.seeking:
+                continue
+            shared = subject.genres & candidate.genres
+            score = len(shared)
+            if candidate.state == subject.state:
+                score += STATE_BONUS
+                if candidate.city == subject.city:
+                    score += CITY_BONUS
+            ranked.append((-score, candidate_id, candidate, shared))
+    ranked.sort(key=lambda item: item[:2])
+    start = (page - 1) * per_page
+    return len(ranked), [{
+        "id": candidate_id,
+        "name": candidate.name,
+        "city": candidate.city,
+        "state": candidate.state,
+        "shared_genres": sorted(shared),
+        "score": -score,
+    } for score, candidate_id, candidate, shared in
+        ranked[start:start + per_page]]
+
+
+def recommendations_response(model, entity_id, other):
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(max(request.args.get(
+        'per_page', app.config['RECOMMENDATIONS_PER_PAGE'], type=int), 1),
+        app.config['MAX_PER_PAGE'])
+    result = recommend(model, entity_id, other, page, per_page)
+    if result is None:
+        abort(404)
+    total, data = result
+    response = jsonify({
+        "id": entity_id,
+        "total": total,
+        "page": page,
+        "per_page": per_page,
+        "data": data,
+    })
+    response.cache_control.public = True
+    response.cache_control.max_age = app.config['RECOMMENDATIONS_MAX_AGE']
+    response.add_etag()
+    return response.make_conditional(request)
+
+
+@app.route('/venues/<int:venue_id>/recommendations')
+def venue_recommendations(venue_id):
+    return recommendations_response(Venue, venue_id, Artist)
+
+
+@app.route('/artists/<int:artist_id>/recommendations')
+def artist_recommendations(artist_id):
+    return recommendations_response(Artist, artist_id, Venue)
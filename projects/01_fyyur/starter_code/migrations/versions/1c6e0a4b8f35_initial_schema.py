@@ -0,0 +1,76 @@
+"""initial schema
+
+The venue, artist and shows tables as the models first defined them. The
+later revisions add the indexes, counters and constraints on top, so
+``flask db upgrade`` builds the whole schema on an empty database.
+
+Databases created by the old ``db.create_all()`` at import already have
+these tables; mark them with ``flask db stamp 1c6e0a4b8f35`` before
+running ``flask db upgrade``.
+
+Revision ID: 1c6e0a4b8f35
+Revises:
+Create Date: 2026-10-18 09:05:21.604117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '1c6e0a4b8f35'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'venue',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(), nullable=True),
+        sa.Column('city', sa.String(length=120), nullable=True),
+        sa.Column('state', sa.String(length=120), nullable=True),
+        sa.Column('address', sa.String(length=120), nullable=True),
+        sa.Column('phone', sa.String(length=120), nullable=True),
+        sa.Column('image_link', sa.String(length=500), nullable=True),
+        sa.Column('facebook_link', sa.String(length=120), nullable=True),
+        sa.Column('website_link', sa.String(length=300), nullable=True),
+        sa.Column('genres', postgresql.ARRAY(sa.String()), nullable=True),
+        sa.Column('seeking_description', sa.String(), nullable=True),
+        sa.Column('seeking_talent', sa.String(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table(
+        'artist',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(), nullable=True),
+        sa.Column('city', sa.String(length=120), nullable=True),
+        sa.Column('state', sa.String(length=120), nullable=True),
+        sa.Column('phone', sa.String(length=120), nullable=True),
+        sa.Column('genres', postgresql.ARRAY(sa.String()), nullable=True),
+        sa.Column('image_link', sa.String(length=500), nullable=True),
+        sa.Column('facebook_link', sa.String(length=120), nullable=True),
+        sa.Column('seeking_description', sa.String(), nullable=True),
+        sa.Column('website_link', sa.String(length=300), nullable=True),
+        sa.Column('seeking_venue', sa.String(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table(
+        'shows',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(), nullable=True),
+        sa.Column('venue_id', sa.Integer(), nullable=False),
+        sa.Column('artist_id', sa.Integer(), nullable=False),
+        sa.Column('start_time', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['artist_id'], ['artist.id'], ),
+        sa.ForeignKeyConstraint(['venue_id'], ['venue.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('shows')
+    op.drop_table('artist')
+    op.drop_table('venue')
@@ -0,0 +1,51 @@
+"""search indexes
+
+Full-text and trigram indexes used by search.py on PostgreSQL.
+
+Revision ID: 3f1c2a7d9b10
+Revises: 1c6e0a4b8f35
+Create Date: 2026-10-18 09:12:40.118392
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1c2a7d9b10'
+down_revision = '1c6e0a4b8f35'
+branch_labels = None
+depends_on = None
+
+SEARCH_DOCUMENT_FUNCTION = """
+CREATE OR REPLACE FUNCTION fyyur_search_document(name text, city text,
+                                                 genres text[])
+RETURNS tsvector LANGUAGE sql IMMUTABLE AS $$
+    SELECT setweight(to_tsvector('simple', coalesce(name, '')), 'A') ||
+           setweight(to_tsvector('simple', coalesce(city, '')), 'B') ||
+           setweight(to_tsvector('simple',
+                                 coalesce(array_to_string(genres, ' '), '')),
+                     'C')
+$$
+"""
+
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.execute(SEARCH_DOCUMENT_FUNCTION)
+    for table in ('venue', 'artist'):
+        op.create_index(
+            'ix_{}_search_document'.format(table), table,
+            [sa.text('fyyur_search_document(name, city, genres)')],
+            postgresql_using='gin')
+        op.create_index(
+            'ix_{}_name_trgm'.format(table), table, ['name'],
+            postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+
+
+def downgrade():
+    for table in ('venue', 'artist'):
+        op.drop_index('ix_{}_name_trgm'.format(table), table_name=table)
+        op.drop_index('ix_{}_search_document'.format(table), table_name=table)
+    op.execute('DROP FUNCTION IF EXISTS '
+               'fyyur_search_document(text, text, text[])')
@@ -0,0 +1,38 @@
+"""genre indexes
+
+GIN indexes on venue.genres and artist.genres. The genre filters on the
+listing and search pages use them for ``@>`` (all genres) and ``&&``
+(any genre). They are built CONCURRENTLY like the show lookup indexes.
+
+Revision ID: 4d8f0b6e3a21
+Revises: e7b3a91f2c58
+Create Date: 2026-10-18 12:41:06.217385
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '4d8f0b6e3a21'
+down_revision = 'e7b3a91f2c58'
+branch_labels = None
+depends_on = None
+
+INDEXES = (
+    ('ix_venue_genres', 'venue'),
+    ('ix_artist_genres', 'artist'),
+)
+
+
+def upgrade():
+    # IF NOT EXISTS: databases built with db.create_all() already have them.
+    with op.get_context().autocommit_block():
+        for name, table in INDEXES:
+            op.execute('CREATE INDEX CONCURRENTLY IF NOT EXISTS {} '
+                       'ON {} USING gin (genres)'.format(name, table))
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table in INDEXES:
+            op.execute('DROP INDEX CONCURRENTLY IF EXISTS {}'.format(name))
@@ -0,0 +1,56 @@
+"""upcoming show counters
+
+Adds the denormalized venue/artist upcoming_shows_count columns and the
+sweep watermark maintained by counters.py, and backfills both.
+
+Revision ID: 8a4e6b2c0d17
+Revises: 3f1c2a7d9b10
+Create Date: 2026-10-18 10:02:15.530871
+
+"""
+from datetime import datetime
+
+from alembic import context, op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8a4e6b2c0d17'
+down_revision = '3f1c2a7d9b10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ('venue', 'artist'):
+        op.add_column(table, sa.Column('upcoming_shows_count', sa.Integer(),
+                                       nullable=False, server_default='0'))
+    sweep = op.create_table(
+        'show_counter_sweep',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('swept_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+
+    # The app compares naive local datetimes, so the watermark is taken
+    # from Python rather than the database clock. A --sql script runs later,
+    # so it falls back to the database's LOCALTIMESTAMP, which matches as
+    # long as the server's TimeZone is the app's.
+    if context.is_offline_mode():
+        now = sa.func.localtimestamp()
+    else:
+        now = sa.literal(datetime.now(), sa.DateTime())
+    op.execute(sweep.insert().values(id=1, swept_at=now))
+    for table, key in (('venue', 'venue_id'), ('artist', 'artist_id')):
+        op.execute('''
+            UPDATE {table} SET upcoming_shows_count = (
+                SELECT count(*) FROM shows
+                WHERE shows.{key} = {table}.id AND shows.start_time > (
+                    SELECT swept_at FROM show_counter_sweep))
+        '''.format(table=table, key=key))
+
+
+def downgrade():
+    op.drop_table('show_counter_sweep')
+    for table in ('venue', 'artist'):
+        op.drop_column(table, 'upcoming_shows_count')
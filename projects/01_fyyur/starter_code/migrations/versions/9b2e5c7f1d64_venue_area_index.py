@@ -0,0 +1,32 @@
+"""venue area index
+
+/venues pages through venues by (state, city, id) with keyset cursors. The
+sort key is coalesced so that comparisons never see NULL, and this index
+covers the same expressions. It is built CONCURRENTLY like the other
+lookup indexes.
+
+Revision ID: 9b2e5c7f1d64
+Revises: 4d8f0b6e3a21
+Create Date: 2026-10-18 13:18:52.640173
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '9b2e5c7f1d64'
+down_revision = '4d8f0b6e3a21'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # IF NOT EXISTS: databases built with db.create_all() already have it.
+    with op.get_context().autocommit_block():
+        op.execute("CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_venue_area "
+                   "ON venue (coalesce(state, ''), coalesce(city, ''), id)")
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.execute('DROP INDEX CONCURRENTLY IF EXISTS ix_venue_area')
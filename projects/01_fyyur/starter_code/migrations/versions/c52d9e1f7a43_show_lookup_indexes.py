@@ -0,0 +1,40 @@
+"""show lookup indexes
+
+Composite indexes for the venue/artist + start_time lookups and the
+(start_time, id) keyset on /shows. They are built CONCURRENTLY so the
+shows table stays writable; that can't run inside a transaction, hence
+the autocommit block.
+
+Revision ID: c52d9e1f7a43
+Revises: 8a4e6b2c0d17
+Create Date: 2026-10-18 11:20:47.902114
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'c52d9e1f7a43'
+down_revision = '8a4e6b2c0d17'
+branch_labels = None
+depends_on = None
+
+INDEXES = (
+    ('ix_shows_venue_id_start_time', ['venue_id', 'start_time']),
+    ('ix_shows_artist_id_start_time', ['artist_id', 'start_time']),
+    ('ix_shows_start_time_id', ['start_time', 'id']),
+)
+
+
+def upgrade():
+    # IF NOT EXISTS: databases built with db.create_all() already have them.
+    with op.get_context().autocommit_block():
+        for name, columns in INDEXES:
+            op.execute('CREATE INDEX CONCURRENTLY IF NOT EXISTS {} '
+                       'ON shows ({})'.format(name, ', '.join(columns)))
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, columns in INDEXES:
+            op.execute('DROP INDEX CONCURRENTLY IF EXISTS {}'.format(name))
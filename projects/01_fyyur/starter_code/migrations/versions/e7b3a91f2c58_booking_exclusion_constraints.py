@@ -0,0 +1,50 @@
+"""booking exclusion constraints
+
+A venue or an artist can't hold two shows whose slots overlap. Each show
+occupies tsrange(start_time, start_time + SHOW_DURATION_MINUTES), with the
+duration read from the app config, the same value booking.py uses. GiST
+exclusion constraints enforce this, so two concurrent bookings can't both
+commit after passing the check in booking.py. Mixing ``=`` on an integer
+column into a GiST constraint needs btree_gist.
+
+Existing overlapping shows make the upgrade fail; find them with
+booking.find_conflicts and move or delete them first. The constraints keep
+the duration they were created with: after changing SHOW_DURATION_MINUTES,
+recreate them with ``flask db downgrade c52d9e1f7a43`` and
+``flask db upgrade`` (or a new revision running the same statements).
+
+Revision ID: e7b3a91f2c58
+Revises: c52d9e1f7a43
+Create Date: 2026-10-18 12:05:13.481920
+
+"""
+from alembic import op
+from flask import current_app
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7b3a91f2c58'
+down_revision = 'c52d9e1f7a43'
+branch_labels = None
+depends_on = None
+
+SLOT = "tsrange(start_time, start_time + interval '{} minutes')"
+
+CONSTRAINTS = (
+    ('ex_shows_venue_slot', 'venue_id'),
+    ('ex_shows_artist_slot', 'artist_id'),
+)
+
+
+def upgrade():
+    slot = SLOT.format(int(current_app.config['SHOW_DURATION_MINUTES']))
+    op.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    for name, column in CONSTRAINTS:
+        op.execute('ALTER TABLE shows ADD CONSTRAINT {} EXCLUDE USING gist '
+                   '({} WITH =, {} WITH &&)'.format(name, column, slot))
+
+
+def downgrade():
+    for name, column in CONSTRAINTS:
+        op.execute('ALTER TABLE shows DROP CONSTRAINT IF EXISTS {}'.format(
+            name))
@@ -1,6 +1,15 @@
+import os
+from datetime import datetime
+
+import click
 from flask import Flask
 from flask_moment import Moment
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import JSON, String, func
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.types import TypeDecorator
+
+import pooling
 
 # ----------------------------------------------------------------------------#
 # App Config.
@@ -9,14 +18,44 @@ from flask_sqlalchemy import SQLAlchemy
 app = Flask(__name__)
 moment = Moment(app)
 app.config.from_object('config')
+app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS',
+                      pooling.engine_options(app.config))
 db = SQLAlchemy(app)
 
+# Flask-Migrate imports alembic, a large part of the app's import time, and
+# only the ``flask db`` commands use it. The flask CLI sets this variable;
+# app servers and tests don't, so their workers start without it.
+if os.environ.get('FLASK_RUN_FROM_CLI') == 'true':
+    from flask_migrate import Migrate
+    migrate = Migrate(app, db)
+
 
 # ----------------------------------------------------------------------------#
 # Models.
 # ----------------------------------------------------------------------------#
+
+class GenreList(TypeDecorator):
+    """A list of genre names.
+
+    ``VARCHAR[]`` on PostgreSQL, where genres.py filters with the array
+    operators and GIN indexes; a JSON array on other databases (SQLite test
+    and benchmark runs).
+    """
+    impl = JSON
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect):
+        if dialect.name == 'postgresql':
+            return dialect.type_descriptor(postgresql.ARRAY(String))
+        return dialect.type_descriptor(JSON())
+
+
 class Venue(db.Model):
     __tablename__ = 'venue'
+    # Genre filters use array containment/overlap; see genres.py.
+    __table_args__ = (
+        db.Index('ix_venue_genres', 'genres', postgresql_using='gin'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
     city = db.Column(db.String(120))
@@ -26,9 +65,12 @@ class Venue(db.Model):
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
     website_link = db.Column(db.String(300))
-    genres = db.Column(db.ARRAY(db.String))
+    genres = db.Column(GenreList)
     seeking_description = db.Column(db.String)
     seeking_talent = db.Column(db.String)
+    # Maintained by counters.py; see ShowCounterSweep.
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0,
+                                     server_default='0')
     shows = db.relationship('Show', backref="venue", lazy=True)
 
     def __repr__(self):
@@ -37,20 +79,32 @@ class Venue(db.Model):
     # TODO: implement any missing fields, as a database migration using Flask-Migrate
 
 
+# /venues pages through venues by area. Coalesced so that keyset comparisons
+# never meet a NULL; ix_venue_area indexes the same expressions.
+venue_area = (func.coalesce(Venue.state, ''), func.coalesce(Venue.city, ''))
+db.Index('ix_venue_area', *venue_area, Venue.id)
+
+
 class Artist(db.Model):
     __tablename__ = 'artist'
+    __table_args__ = (
+        db.Index('ix_artist_genres', 'genres', postgresql_using='gin'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
     city = db.Column(db.String(120))
     state = db.Column(db.String(120))
     phone = db.Column(db.String(120))
-    genres = db.Column(db.ARRAY(db.String))
+    genres = db.Column(GenreList)
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
     seeking_description = db.Column(db.String)
     website_link = db.Column(db.String(300))
     seeking_venue = db.Column(db.String)
     seeking_description = db.Column(db.String)
+    # Maintained by counters.py; see ShowCounterSweep.
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0,
+                                     server_default='0')
     shows = db.relationship('Show', backref="artist", lazy=True)
 
     # TODO: implement any missing fields, as a database migration using Flask-Migrate
@@ -61,6 +115,14 @@ class Artist(db.Model):
 
 class Show(db.Model):
     __tablename__ = 'shows'
+    # Every page filters shows by venue or artist and start time, /shows
+    # pages through (start_time, id) and the counter sweep scans a
+    # start_time range.
+    __table_args__ = (
+        db.Index('ix_shows_venue_id_start_time', 'venue_id', 'start_time'),
+        db.Index('ix_shows_artist_id_start_time', 'artist_id', 'start_time'),
+        db.Index('ix_shows_start_time_id', 'start_time', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
     venue_id = db.Column(db.Integer, db.ForeignKey('venue.id'),
@@ -72,7 +134,57 @@ class Show(db.Model):
     def __repr__(self):
         return '<Show {}{}>'.format(self.artist_id, self.venue_id)
 
+    @classmethod
+    def upcoming_counts(cls, key, now):
+        """Subquery of upcoming show counts grouped by ``key``.
 
-db.create_all()
+        ``key`` is ``Show.venue_id`` or ``Show.artist_id``; the result has an
+        ``id`` and a ``num_upcoming_shows`` column to outer join against.
+        """
+        return db.session.query(
+            key.label('id'),
+            func.count(cls.id).label('num_upcoming_shows')).filter(
+            cls.start_time > now).group_by(key).subquery()
 
-# TODO Implement Show and Artist models, and complete all model relationships and properties, as a database migration.
+
+class ShowCounterSweep(db.Model):
+    """Single-row watermark for the upcoming show counters.
+
+    ``upcoming_shows_count`` on venues and artists counts the shows starting
+    after ``swept_at``; the periodic sweep moves it forward.
+    """
+    __tablename__ = 'show_counter_sweep'
+    id = db.Column(db.Integer, primary_key=True)
+    swept_at = db.Column(db.DateTime, nullable=False)
+
+
+def init_db(drop=False):
+    """Create any missing tables, after dropping them all if ``drop``.
+
+    Seeds the counter sweep watermark like the migrations do; without it
+    every past show would count as upcoming until the first sweep.
+    """
+    if drop:
+        db.drop_all()
+    db.create_all()
+    if ShowCounterSweep.query.first() is None:
+        db.session.add(ShowCounterSweep(id=1, swept_at=datetime.now()))
+        db.session.commit()
+
+
+@app.cli.command('init-db')
+@click.option('--drop', is_flag=True, help='Drop all tables first.')
+def init_db_command(drop):
+    """Create the tables from the models.
+
+    Meant for SQLite and scratch databases. PostgreSQL databases should be
+    built with ``flask db upgrade`` instead, which also adds the search
+    functions and booking constraints that only exist in the migrations;
+    don't run both on the same database.
+    """
+    init_db(drop)
+    click.echo('Initialized {}.'.format(db.engine.url.render_as_string(
+        hide_password=True)))
+
+# TODO Implement Show and Artist models, and complete all model relationships
+# and properties, as a database migration.
@@ -0,0 +1,198 @@
+"""Keyset pagination with opaque cursors.
+
+Each listing has a fixed sort order that ends in a unique column
+(normally ``id``). A page is the ``per_page`` rows that come strictly after
+(or, going back, strictly before) the sort key of a boundary row. Deep
+pages therefore cost the same as the first: the database seeks into the
+index instead of counting through an OFFSET.
+
+The boundary key is sent to the client as a ``cursor`` argument. This is
+base64url-encoded JSON, treated as opaque, and it records which way to
+page. ``page_url()`` builds the next/previous links for the pager template
+and keeps the request's other arguments (search term, genre filters,
+per_page).
+"""
+import base64
+import binascii
+import json
+import numbers
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+from datetime import datetime
+
+from flask import current_app, request, url_for
+from sqlalchemy import and_, or_, tuple_
+
+from models import app
+
+NEXT = 'next'
+PREV = 'prev'
+
+
+class Key(namedtuple('Key', 'column name descending')):
+    """A sort column and the attribute holding its value on result rows."""
+
+    def __new__(cls, column, name=None, descending=False):
+        return super(Key, cls).__new__(cls, column, name or column.key,
+                                       descending)
+
+
+class Page(namedtuple('Page', 'items next_cursor prev_cursor')):
+    pass
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+# ----------------------------------------------------------------------------#
+# Cursor tokens.
+# ----------------------------------------------------------------------------#
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {'dt': value.isoformat()}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict):
+        return datetime.fromisoformat(value['dt'])
+    if isinstance(value, list):
+        raise ValueError(value)
+    return value
+
+
+def _check_value(key, value):
+    """Raise InvalidCursor unless ``value`` fits ``key``'s column type.
+
+    Cursors come from the client; a value of the wrong type would otherwise
+    fail in the database, as a 500.
+    """
+    if value is None:
+        return
+    try:
+        expected = key.column.type.python_type
+    except NotImplementedError:
+        return
+    if issubclass(expected, numbers.Number) and expected is not bool:
+        expected = numbers.Number
+    if not isinstance(value, expected) or \
+            isinstance(value, bool) and expected is not bool:
+        raise InvalidCursor(value)
+
+
+def encode_cursor(values, direction=NEXT):
+    payload = json.dumps([direction] + [_encode_value(v) for v in values],
+                         separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token, size=None):
+    """Return ``(direction, values)``, or raise InvalidCursor.
+
+    ``size`` is the expected number of key values, if known.
+    """
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(
+            token + '=' * (-len(token) % 4)).decode())
+        direction, values = payload[0], payload[1:]
+        if direction not in (NEXT, PREV) or \
+                size is not None and len(values) != size:
+            raise ValueError(token)
+        return direction, [_decode_value(value) for value in values]
+    except (binascii.Error, ValueError, TypeError, KeyError, IndexError):
+        raise InvalidCursor(token)
+
+
+# ----------------------------------------------------------------------------#
+# Pages.
+# ----------------------------------------------------------------------------#
+
+def per_page(setting):
+    """The request's ``per_page``, defaulting to ``setting``, capped."""
+    size = request.args.get('per_page', current_app.config[setting],
+                            type=int)
+    return max(1, min(size, current_app.config['MAX_PER_PAGE']))
+
+
+def _beyond(keys, values, direction):
+    """Rows strictly after ``values`` in ``keys`` order (before for PREV).
+
+    When every key sorts the same way this is a row comparison,
+    ``(a, b) > (x, y)``, which the database answers as an index range.
+    Mixed directions are expanded into ``a < x OR (a = x AND b > y)``.
+    """
+    greater = [key.descending == (direction == PREV) for key in keys]
+    if len(set(greater)) == 1:
+        row = tuple_(*[key.column for key in keys])
+        bound = tuple_(*values)
+        return row > bound if greater[0] else row < bound
+    clauses = []
+    for i, key in enumerate(keys):
+        op = key.column.__gt__ if greater[i] else key.column.__lt__
+        clauses.append(and_(*[keys[j].column == values[j]
+                              for j in range(i)] + [op(values[i])]))
+    return or_(*clauses)
+
+
+def _page(rows, size, direction, cursor, key_of):
+    more = len(rows) > size
+    rows = rows[:size]
+    if direction == PREV:
+        rows.reverse()
+    has_next = more if direction == NEXT else cursor is not None
+    has_prev = more if direction == PREV else cursor is not None
+    return Page(
+        rows,
+        encode_cursor(key_of(rows[-1]), NEXT) if rows and has_next else None,
+        encode_cursor(key_of(rows[0]), PREV) if rows and has_prev else None)
+
+
+def paginate(query, keys, cursor=None, size=30):
+    """Fetch one page of ``query`` ordered by ``keys``.
+
+    Costs one query; a row past the page tells whether there is more.
+    """
+    direction = NEXT
+    if cursor:
+        direction, values = decode_cursor(cursor, len(keys))
+        for key, value in zip(keys, values):
+            _check_value(key, value)
+        query = query.filter(_beyond(keys, values, direction))
+    reverse = direction == PREV
+    query = query.order_by(*[
+        key.column.desc() if key.descending != reverse else key.column.asc()
+        for key in keys])
+    return _page(query.limit(size + 1).all(), size, direction, cursor,
+                 lambda row: [getattr(row, key.name) for key in keys])
+
+
+def paginate_list(items, key_of, cursor=None, size=30):
+    """Like ``paginate`` for a list already sorted by ``key_of``."""
+    direction = NEXT
+    keys = [tuple(key_of(item)) for item in items]
+    if cursor:
+        direction, values = decode_cursor(cursor, len(keys[0]) if keys
+                                          else None)
+        try:
+            if direction == NEXT:
+                start = bisect_right(keys, tuple(values))
+                rows = items[start:start + size + 1]
+            else:
+                end = bisect_left(keys, tuple(values))
+                rows = items[max(end - size - 1, 0):end][::-1]
+        except TypeError:
+            raise InvalidCursor(cursor)
+    else:
+        rows = items[:size + 1]
+    return _page(list(rows), size, direction, cursor,
+                 lambda item: list(key_of(item)))
+
+
+@app.template_global()
+def page_url(cursor):
+    """This page's URL with ``cursor`` swapped in."""
+    args = request.values.to_dict(flat=False)
+    args['cursor'] = cursor
+    return url_for(request.endpoint, **dict(request.view_args, **args))
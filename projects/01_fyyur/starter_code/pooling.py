@@ -0,0 +1,183 @@
+"""Database connection pool profiles and metrics.
+
+DB_POOL_PROFILE picks pool settings that fit how the app is served:
+
+* ``dev`` -- the flask dev server; SQLAlchemy's default sizes.
+* ``gunicorn-sync`` -- sync workers handle one request at a time, so each
+  process needs one connection plus a little headroom for streamed
+  exports.
+* ``gevent`` -- one process serves many greenlets at once, so it gets a
+  larger pool and a short wait before failing fast.
+
+Individual settings can be overridden from the environment (see
+config.py). On PostgreSQL every connection also gets a
+``statement_timeout``, so a runaway query can't hold a connection forever.
+An in-memory SQLite database lives and dies with its connection, so it
+gets one shared connection instead of a pool.
+
+Checkouts, checkins, new connections and invalidations are counted from
+pool events. The time a request waits for a connection is measured in the
+pool itself, because no event fires while a checkout is blocked.
+``/internal/pool`` reports the counters together with the pool's current
+state.
+"""
+import threading
+import time
+
+from sqlalchemy import event, exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool, StaticPool
+
+PROFILES = {
+    'dev': {
+        'pool_size': 5,
+        'max_overflow': 10,
+        'pool_timeout': 30,
+    },
+    'gunicorn-sync': {
+        'pool_size': 1,
+        'max_overflow': 2,
+        'pool_timeout': 10,
+    },
+    'gevent': {
+        'pool_size': 20,
+        'max_overflow': 10,
+        'pool_timeout': 5,
+    },
+}
+
+# Config keys that override the profile's values.
+OVERRIDES = {
+    'pool_size': 'DB_POOL_SIZE',
+    'max_overflow': 'DB_MAX_OVERFLOW',
+    'pool_timeout': 'DB_POOL_TIMEOUT',
+}
+
+
+class PoolMetrics(object):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.connects = 0
+            self.checkouts = 0
+            self.checkins = 0
+            self.invalidations = 0
+            self.timeouts = 0
+            self.waits = 0
+            self.wait_seconds = 0.0
+            self.max_wait_seconds = 0.0
+            self.checked_out = 0
+            self.peak_checked_out = 0
+
+    def incr(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def checked_out_changed(self, delta):
+        with self._lock:
+            self.checked_out += delta
+            self.peak_checked_out = max(self.peak_checked_out,
+                                        self.checked_out)
+
+    def waited(self, seconds):
+        with self._lock:
+            self.waits += 1
+            self.wait_seconds += seconds
+            self.max_wait_seconds = max(self.max_wait_seconds, seconds)
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                "connects": self.connects,
+                "checkouts": self.checkouts,
+                "checkins": self.checkins,
+                "invalidations": self.invalidations,
+                "timeouts": self.timeouts,
+                "peak_checked_out": self.peak_checked_out,
+                "wait_seconds_total": round(self.wait_seconds, 6),
+                "wait_seconds_max": round(self.max_wait_seconds, 6),
+                "wait_seconds_avg": round(self.wait_seconds / self.waits, 6)
+                if self.waits else None,
+            }
+
+
+metrics = PoolMetrics()
+
+
+class MeteredQueuePool(QueuePool):
+    """A QueuePool that times how long checkouts wait for a connection."""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super(MeteredQueuePool, self)._do_get()
+        except exc.TimeoutError:
+            metrics.incr('timeouts')
+            raise
+        finally:
+            metrics.waited(time.perf_counter() - started)
+
+
+@event.listens_for(MeteredQueuePool, 'connect')
+def _on_connect(dbapi_connection, connection_record):
+    metrics.incr('connects')
+
+
+@event.listens_for(MeteredQueuePool, 'checkout')
+def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+    metrics.incr('checkouts')
+    metrics.checked_out_changed(1)
+
+
+@event.listens_for(MeteredQueuePool, 'checkin')
+def _on_checkin(dbapi_connection, connection_record):
+    metrics.incr('checkins')
+    metrics.checked_out_changed(-1)
+
+
+@event.listens_for(MeteredQueuePool, 'invalidate')
+def _on_invalidate(dbapi_connection, connection_record, exception):
+    metrics.incr('invalidations')
+
+
+def engine_options(config):
+    """SQLALCHEMY_ENGINE_OPTIONS for the configured pool profile."""
+    profile = config['DB_POOL_PROFILE']
+    if profile not in PROFILES:
+        raise ValueError('Unknown DB_POOL_PROFILE: {!r}'.format(profile))
+    url = make_url(config['SQLALCHEMY_DATABASE_URI'])
+    if url.get_backend_name() == 'sqlite' and \
+            url.database in (None, '', ':memory:'):
+        return {'poolclass': StaticPool,
+                'connect_args': {'check_same_thread': False}}
+    options = dict(PROFILES[profile],
+                   poolclass=MeteredQueuePool,
+                   pool_pre_ping=True,
+                   pool_recycle=config['DB_POOL_RECYCLE'])
+    for option, key in OVERRIDES.items():
+        if config.get(key) is not None:
+            options[option] = config[key]
+    timeout = config.get('DB_STATEMENT_TIMEOUT_MS')
+    if timeout and config['SQLALCHEMY_DATABASE_URI'].startswith('postgres'):
+        options['connect_args'] = {
+            'options': '-c statement_timeout={:d}'.format(timeout)}
+    return options
+
+
+def pool_stats(engine, profile):
+    pool = engine.pool
+    status = {"profile": profile, "class": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        status.update({
+            "size": pool.size(),
+            "checked_in": pool.checkedin(),
+            "checked_out": pool.checkedout(),
+            "overflow": pool.overflow(),
+            "max_overflow": pool._max_overflow,
+            "timeout": pool.timeout(),
+        })
+    status.update(metrics.as_dict())
+    return status
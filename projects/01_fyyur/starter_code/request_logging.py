@@ -0,0 +1,118 @@
+"""Non-blocking, structured application logging.
+
+Request threads never write to disk. ``app.logger`` gets a QueueHandler
+that only puts records on an in-memory queue. A QueueListener thread drains
+the queue into LOG_FILE, one JSON object per line, and in debug mode to
+stderr as well.
+
+Every gunicorn worker appends to the same file, so none of them rotates
+it: renaming the file under the other workers would lose records. Rotate
+it with logrotate instead; the WatchedFileHandler reopens the file once it
+has been moved.
+
+Each request gets an id, taken from an incoming ``X-Request-ID`` header or
+generated, and echoed back in the response. Records logged during a request
+carry that id and the route. One summary record per request adds the
+status and duration, plus the SQL statement count and database time that
+querycount.py collects.
+"""
+import atexit
+import json
+import logging
+import queue
+import time
+import uuid
+from logging.handlers import QueueHandler, QueueListener, \
+    WatchedFileHandler
+
+from flask import g, has_request_context, request
+from flask.logging import default_handler
+
+import querycount
+
+# Attributes copied from a record into its JSON line when present.
+CONTEXT_FIELDS = ('request_id', 'method', 'route', 'path', 'status',
+                  'duration_ms', 'query_count', 'db_ms')
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for field in CONTEXT_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        return json.dumps(entry)
+
+
+class RequestContextFilter(logging.Filter):
+    """Stamp records with the current request's id and route."""
+
+    def filter(self, record):
+        if has_request_context():
+            record.request_id = getattr(g, 'request_id', None)
+            record.method = request.method
+            record.route = request.url_rule.rule if request.url_rule \
+                else None
+            record.path = request.path
+        return True
+
+
+def init_logging(app):
+    """Route ``app.logger`` through a queue to a JSON log file."""
+    file_handler = WatchedFileHandler(app.config['LOG_FILE'],
+                                      encoding='utf-8')
+    file_handler.setFormatter(JsonFormatter())
+    handlers = [file_handler]
+    if app.debug:
+        # Keep the console output of the development server, written by
+        # the listener thread like the file.
+        stream_handler = logging.StreamHandler()
+        stream_handler.setFormatter(default_handler.formatter)
+        handlers.append(stream_handler)
+
+    # The filter runs on the request thread, where the context is
+    # available. QueueHandler then merges the arguments and renders any
+    # traceback into the message before the record crosses threads.
+    log_queue = queue.Queue(-1)
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.addFilter(RequestContextFilter())
+    listener = QueueListener(log_queue, *handlers,
+                             respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+
+    app.logger.setLevel(app.config['LOG_LEVEL'])
+    app.logger.addHandler(queue_handler)
+    # Flask's default handler writes to stderr on the request thread.
+    app.logger.removeHandler(default_handler)
+
+    @app.before_request
+    def start_request_log():
+        g.request_id = request.headers.get('X-Request-ID') or \
+            uuid.uuid4().hex
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def finish_request_log(response):
+        if 'request_started' in g:
+            queries = querycount.current()
+            app.logger.info('%s %s %s', request.method, request.path,
+                            response.status_code, extra={
+                                'status': response.status_code,
+                                'duration_ms': round(
+                                    (time.perf_counter() -
+                                     g.request_started) * 1000, 2),
+                                'query_count': queries and queries.count,
+                                'db_ms': queries and round(
+                                    queries.seconds * 1000, 2),
+                            })
+            response.headers['X-Request-ID'] = g.request_id
+        return response
+
+    return listener
@@ -0,0 +1,236 @@
+"""Venue and artist search.
+
+On PostgreSQL, search runs against the GIN indexes created by the
+``search indexes`` migration. A prefix ``tsquery`` matches name, city and
+genres through ``fyyur_search_document()``, and a trigram index on ``name``
+keeps substring matches indexable. Other databases (SQLite test runs) fall
+back to an in-process inverted index that is rebuilt lazily after committed
+writes.
+
+Both paths take an optional genre filter (see genres.py). Results are
+ordered by rank and paged with the cursors from pagination.py. Both return
+the same ``{"count": ..., "data": [...], "next_cursor": ...,
+"prev_cursor": ...}`` shape that the search templates expect. Upcoming show
+counts are read from the denormalized ``upcoming_shows_count`` columns (see
+counters.py).
+"""
+import re
+from bisect import bisect_left
+
+from flask import current_app
+from sqlalchemy import cast, event, func, literal_column, or_
+from sqlalchemy.orm import Session, object_session
+
+import pagination
+from genres import genre_filter
+from models import db, Venue, Artist
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(text):
+    """Lower-cased word tokens of ``text``; safe to use in a ``tsquery``."""
+    if not text:
+        return []
+    return TOKEN_RE.findall(text.lower())
+
+
+def _escape_like(term):
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+# ----------------------------------------------------------------------------#
+# Pure-Python fallback.
+# ----------------------------------------------------------------------------#
+
+class InvertedIndex(object):
+    """Token -> {id: weight} postings with prefix lookup.
+
+    Every query token has to prefix-match some token of a document, which
+    mirrors the ``tok:* & tok:*`` query used on PostgreSQL. A document's
+    score is the sum of the best field weight matched by each query token.
+    """
+
+    FIELD_WEIGHTS = {'name': 1.0, 'city': 0.4, 'genres': 0.2}
+
+    def __init__(self):
+        self._postings = {}
+        self._tokens = []
+        self.genres = {}
+
+    def build(self, rows):
+        """(Re)build from ``(id, name, city, genres)`` rows."""
+        postings = {}
+        self.genres = {}
+        for entity_id, name, city, genres in rows:
+            self.genres[entity_id] = set(genres or [])
+            fields = {'name': name, 'city': city,
+                      'genres': ' '.join(genres or [])}
+            for field, text in fields.items():
+                weight = self.FIELD_WEIGHTS[field]
+                for token in tokenize(text):
+                    ids = postings.setdefault(token, {})
+                    if ids.get(entity_id, 0) < weight:
+                        ids[entity_id] = weight
+        self._postings = postings
+        self._tokens = sorted(postings)
+
+    def _prefix_matches(self, prefix):
+        scores = {}
+        i = bisect_left(self._tokens, prefix)
+        while i < len(self._tokens) and self._tokens[i].startswith(prefix):
+            for entity_id, weight in self._postings[self._tokens[i]].items():
+                if scores.get(entity_id, 0) < weight:
+                    scores[entity_id] = weight
+            i += 1
+        return scores
+
+    def search(self, tokens):
+        """Return ``[(id, score)]`` ordered by score, best first."""
+        scores = None
+        for token in tokens:
+            matches = self._prefix_matches(token)
+            if scores is None:
+                scores = matches
+            else:
+                scores = {entity_id: score + matches[entity_id]
+                          for entity_id, score in scores.items()
+                          if entity_id in matches}
+            if not scores:
+                return []
+        return sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+
+
+_fallback_indexes = {}
+_stale = set()
+
+
+def mark_stale(model):
+    """Rebuild ``model``'s fallback index on its next search."""
+    _stale.add(model)
+
+
+# Mapper events fire at flush time, so the changed models are noted on the
+# session and marked stale once it commits; a rollback forgets them.
+
+def _mark_stale(mapper, connection, target):
+    object_session(target).info.setdefault('search_stale', set()).add(
+        type(target))
+
+
+def _apply_pending(session):
+    for model in session.info.pop('search_stale', ()):
+        mark_stale(model)
+
+
+def _discard_pending(session, *args):
+    session.info.pop('search_stale', None)
+
+
+for _model in (Venue, Artist):
+    for _event in ('after_insert', 'after_update', 'after_delete'):
+        event.listen(_model, _event, _mark_stale)
+event.listen(Session, 'after_commit', _apply_pending)
+event.listen(Session, 'after_soft_rollback', _discard_pending)
+
+
+def _build_index(model):
+    index = InvertedIndex()
+    index.build(db.session.query(
+        model.id, model.name, model.city, model.genres).all())
+    return index
+
+
+def _fallback_index(model):
+    if model in db.session.info.get('search_stale', ()):
+        # This session has uncommitted changes; index them for it alone.
+        return _build_index(model)
+    index = _fallback_indexes.get(model)
+    if index is None or model in _stale:
+        _stale.discard(model)
+        index = _fallback_indexes[model] = _build_index(model)
+    return index
+
+
+# ----------------------------------------------------------------------------#
+# Search.
+# ----------------------------------------------------------------------------#
+
+def _search_document(model):
+    # Must match the indexed expression in the search indexes migration.
+    return func.fyyur_search_document(model.name, model.city, model.genres)
+
+
+def _genre_match(entity_genres, genres, match):
+    if match == 'any':
+        return not entity_genres.isdisjoint(genres)
+    return entity_genres.issuperset(genres)
+
+
+def _search(model, term, limit, genres=(), match='all', cursor=None):
+    tokens = tokenize(term)
+    limit = limit or current_app.config['SEARCH_RESULT_LIMIT']
+    columns = [model.id, model.name,
+               model.upcoming_shows_count.label('num_upcoming_shows')]
+
+    if db.engine.dialect.name == 'postgresql':
+        # The total is counted over all matches, before the cursor filter.
+        if tokens:
+            tsquery = func.to_tsquery(
+                'simple', ' & '.join(token + ':*' for token in tokens))
+            # real -> double precision, so the rank survives a round trip
+            # through the cursor and still compares equal.
+            rank = cast(func.ts_rank(_search_document(model), tsquery) +
+                        func.similarity(model.name, term), db.Float(53))
+        else:
+            rank = literal_column('0', db.Float(53))
+        matches = db.session.query(*columns, rank.label('rank'),
+                                   func.count().over().label('total'))
+        if tokens:
+            matches = matches.filter(or_(
+                _search_document(model).op('@@')(tsquery),
+                model.name.ilike('%' + _escape_like(term) + '%')))
+        if genres:
+            matches = matches.filter(genre_filter(model, genres, match))
+        matches = matches.subquery()
+        page = pagination.paginate(
+            db.session.query(matches),
+            [pagination.Key(matches.c.rank, 'rank', descending=True),
+             pagination.Key(matches.c.id, 'id')], cursor, limit)
+        rows = page.items
+        total = rows[0].total if rows else 0
+    else:
+        index = _fallback_index(model)
+        if tokens:
+            ranked = index.search(tokens)
+        else:
+            ranked = [(entity_id, 0) for entity_id in sorted(index.genres)]
+        if genres:
+            ranked = [(entity_id, score) for entity_id, score in ranked
+                      if _genre_match(index.genres[entity_id], genres, match)]
+        total = len(ranked)
+        page = pagination.paginate_list(
+            ranked, lambda item: (-item[1], item[0]), cursor, limit)
+        ids = [entity_id for entity_id, score in page.items]
+        by_id = {row.id: row for row in db.session.query(*columns).filter(
+            model.id.in_(ids))}
+        rows = [by_id[entity_id] for entity_id in ids if entity_id in by_id]
+
+    return {
+        "count": total,
+        "data": [{
+            "id": row.id,
+            "name": row.name,
+            "num_upcoming_shows": row.num_upcoming_shows,
+        } for row in rows],
+        "next_cursor": page.next_cursor,
+        "prev_cursor": page.prev_cursor,
+    }
+
+
+def search_venues(term, limit=None, genres=(), match='all', cursor=None):
+    return _search(Venue, term, limit, genres, match, cursor)
+
+
+def search_artists(term, limit=None, genres=(), match='all', cursor=None):
+    return _search(Artist, term, limit, genres, match, cursor)
@@ -0,0 +1,212 @@
+"""Query plan regression tests for the Fyyur views.
+
+Each view is requested against a seeded PostgreSQL database. Every SELECT
+it issues is captured and re-run under EXPLAIN, and the test fails if the
+plan contains a sequential scan the route isn't allowed to do. This needs
+a scratch PostgreSQL database; its tables are dropped and recreated:
+
+    createdb fyyur_test
+    FYYUR_TEST_DATABASE_URL=postgresql://localhost:5432/fyyur_test \\
+        python test_query_plans.py
+"""
+import importlib
+import os
+import unittest
+
+TEST_DATABASE_URL = os.environ.get('FYYUR_TEST_DATABASE_URL')
+if TEST_DATABASE_URL:
+    os.environ['DATABASE_URL'] = TEST_DATABASE_URL
+
+# Large enough that the planner prefers indexes over scanning.
+SEED_VENUES = 20000
+SEED_ARTISTS = 20000
+SEED_SHOWS = 200000
+
+SEED_SQL = '''
+INSERT INTO venue (name, city, state, address, genres, seeking_talent)
+SELECT 'Venue ' || g, 'City ' || (g % 100), 'CA', g || ' Main St',
+       CASE WHEN g % 500 = 0 THEN ARRAY['Jazz', 'Classical']
+            ELSE ARRAY['Jazz', 'Folk'] END, 'false'
+FROM generate_series(1, {venues}) g;
+
+INSERT INTO artist (name, city, state, genres, seeking_venue)
+SELECT 'Artist ' || g, 'City ' || (g % 100), 'NY', ARRAY['Rock n Roll'],
+       'false'
+FROM generate_series(1, {artists}) g;
+
+INSERT INTO shows (venue_id, artist_id, start_time)
+SELECT 1 + g % {venues}, 1 + (g * 7) % {artists},
+       LOCALTIMESTAMP + (g - {shows} / 2) * interval '1 hour'
+FROM generate_series(1, {shows}) g;
+
+UPDATE venue SET upcoming_shows_count = (
+    SELECT count(*) FROM shows
+    WHERE shows.venue_id = venue.id AND start_time > LOCALTIMESTAMP);
+UPDATE artist SET upcoming_shows_count = (
+    SELECT count(*) FROM shows
+    WHERE shows.artist_id = artist.id AND start_time > LOCALTIMESTAMP);
+
+-- Rows inserted after create_all() sit in the GIN pending lists, which the
+-- planner prices as a scan; merge them as autovacuum would.
+SELECT gin_clean_pending_list('ix_venue_genres'::regclass);
+SELECT gin_clean_pending_list('ix_artist_genres'::regclass);
+
+ANALYZE;
+'''.format(venues=SEED_VENUES, artists=SEED_ARTISTS, shows=SEED_SHOWS)
+
+
+def seq_scans(plan):
+    """Relation names of every Seq Scan node in an EXPLAIN JSON plan."""
+    found = set()
+    if plan.get('Node Type') == 'Seq Scan':
+        found.add(plan['Relation Name'])
+    for child in plan.get('Plans', []):
+        found |= seq_scans(child)
+    return found
+
+
+@unittest.skipUnless(TEST_DATABASE_URL,
+                     'set FYYUR_TEST_DATABASE_URL to a scratch PostgreSQL '
+                     'database')
+class QueryPlanTestCase(unittest.TestCase):
+    """Fails when a view's queries fall back to sequential scans."""
+
+    @classmethod
+    def setUpClass(cls):
+        from alembic.migration import MigrationContext
+        from alembic.operations import Operations
+        from sqlalchemy import event, text
+
+        import app as fyyur
+        cls.fyyur = fyyur
+        cls.app = fyyur.app
+        cls.db = fyyur.db
+        cls.app.config['TESTING'] = True
+
+        cls.db.session.remove()
+        cls.db.drop_all()
+        cls.db.create_all()
+        with cls.db.engine.begin() as connection:
+            connection.execute(text(SEED_SQL))
+
+        # Search needs the function and GIN indexes from its migration,
+        # which depends on the pg_trgm extension.
+        cls.search_indexes = True
+        migration = importlib.import_module(
+            'migrations.versions.3f1c2a7d9b10_search_indexes')
+        try:
+            with cls.db.engine.begin() as connection:
+                with Operations.context(
+                        MigrationContext.configure(connection)):
+                    migration.upgrade()
+                connection.execute(text('ANALYZE'))
+        except Exception:
+            cls.search_indexes = False
+
+        cls.statements = []
+
+        def capture(conn, cursor, statement, parameters, context,
+                    executemany):
+            if statement.lstrip().upper().startswith('SELECT'):
+                cls.statements.append((statement, parameters))
+
+        cls.capture = capture
+        event.listen(cls.db.engine, 'before_cursor_execute', capture)
+
+    @classmethod
+    def tearDownClass(cls):
+        from sqlalchemy import event
+        event.remove(cls.db.engine, 'before_cursor_execute', cls.capture)
+        cls.db.session.remove()
+        cls.db.drop_all()
+
+    def setUp(self):
+        self.client = self.app.test_client
+        self.fyyur.detail_cache.clear()
+        self.fyyur.genres.invalidate()
+        del self.statements[:]
+
+    def explain(self, statement, parameters):
+        connection = self.db.engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            cursor.execute('EXPLAIN (FORMAT JSON) ' + statement, parameters)
+            return cursor.fetchone()[0][0]['Plan']
+        finally:
+            connection.close()
+
+    def assertIndexedPlans(self, method, url, allowed=(), data=None,
+                           facets=()):
+        """Fail on sequential scans outside ``allowed``.
+
+        Tables in ``facets`` may only be scanned by the genre facet
+        aggregate, which unnests the genres of the whole table.
+        """
+        with self.subTest(url=url):
+            del self.statements[:]
+            res = getattr(self.client(), method)(url, data=data)
+            self.assertEqual(res.status_code, 200)
+            self.assertTrue(self.statements, 'no queries captured')
+            for statement, parameters in self.statements:
+                permitted = set(allowed)
+                if 'unnest(' in statement:
+                    permitted |= set(facets)
+                scans = seq_scans(self.explain(statement, parameters))
+                self.assertFalse(
+                    scans - permitted,
+                    'sequential scan on {} in:\n{}'.format(
+                        ', '.join(sorted(scans)), statement))
+
+    def test_venue_detail(self):
+        self.assertIndexedPlans('get', '/venues/42')
+
+    def test_artist_detail(self):
+        self.assertIndexedPlans('get', '/artists/42')
+
+    def test_edit_forms(self):
+        self.assertIndexedPlans('get', '/venues/42/edit')
+        self.assertIndexedPlans('get', '/artists/42/edit')
+
+    def test_shows_pages(self):
+        from datetime import datetime
+        from pagination import PREV, encode_cursor
+        self.assertIndexedPlans('get', '/shows')
+        after = encode_cursor([datetime(2030, 1, 1), 10])
+        self.assertIndexedPlans('get', '/shows?cursor=' + after)
+        before = encode_cursor([datetime(2030, 1, 1), 10], PREV)
+        self.assertIndexedPlans('get', '/shows?cursor=' + before)
+
+    def test_listing_pages(self):
+        from pagination import encode_cursor
+        # The home page lists any ten rows; facet counts for the listings
+        # aggregate their whole table.
+        self.assertIndexedPlans('get', '/', allowed={'venue', 'artist'})
+        self.assertIndexedPlans('get', '/venues', facets={'venue'})
+        self.assertIndexedPlans('get', '/artists', facets={'artist'})
+        self.fyyur.genres.invalidate()
+        self.assertIndexedPlans('get', '/venues?genre=Classical&cursor=' +
+                                encode_cursor(['CA', 'City 7', 100]))
+        self.assertIndexedPlans('get', '/artists?genre=Classical&cursor=' +
+                                encode_cursor([15000]))
+
+    def test_genre_filters(self):
+        # Unfiltered facet counts aggregate the whole table by design.
+        self.assertIndexedPlans('get', '/venues?genre=Classical')
+        self.assertIndexedPlans(
+            'get', '/venues?genre=Classical&genre=Blues&match=any')
+
+    def test_search(self):
+        if not self.search_indexes:
+            self.skipTest('pg_trgm is not available')
+        self.assertIndexedPlans('post', '/venues/search', allowed={'venue'},
+                                data={'search_term': 'Venue 12'})
+        self.assertIndexedPlans('post', '/artists/search',
+                                allowed={'artist'},
+                                data={'search_term': 'Artist 12'})
+        self.assertIndexedPlans('get', '/venues/search?search_term=Venue+12'
+                                       '&genre=Classical')
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
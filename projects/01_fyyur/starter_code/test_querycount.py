@@ -0,0 +1,122 @@
+"""Tests for querycount.py, on a throwaway Flask app and SQLite engine.
+
+Needs no database server:
+
+    python test_querycount.py
+"""
+import os
+import unittest
+
+from flask import Flask, jsonify
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+from querycount import QueryCounter, RepeatedQueryError, statement_shape
+
+PROJECTS = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        os.pardir, os.pardir)
+COPIES = ('01_fyyur/starter_code/querycount.py',
+          '02_trivia_api/starter/backend/querycount.py',
+          '03_coffee_shop_full_stack/starter_code/backend/src/querycount.py')
+
+
+class StatementShapeTestCase(unittest.TestCase):
+
+    def test_bound_values_and_literals(self):
+        shapes = {statement_shape(statement) for statement in (
+            'SELECT * FROM venue WHERE id = %(id_1)s',
+            'SELECT * FROM venue WHERE id = %s',
+            'SELECT * FROM venue WHERE id = ?',
+            'SELECT * FROM venue WHERE id = :id',
+            'SELECT * FROM venue WHERE id = $1',
+            'SELECT * FROM venue WHERE id = 42',
+            "SELECT *  FROM venue\n WHERE id = 'it''s'",
+        )}
+        self.assertEqual(shapes, {'SELECT * FROM venue WHERE id = ?'})
+
+    def test_in_lists(self):
+        self.assertEqual(
+            statement_shape('SELECT * FROM shows WHERE venue_id IN (?, ?, ?)'),
+            statement_shape('SELECT * FROM shows WHERE venue_id IN (1)'))
+        self.assertEqual(
+            statement_shape('SELECT * FROM shows WHERE venue_id IN '
+                            '(%(v_1)s, %(v_2)s)'),
+            'SELECT * FROM shows WHERE venue_id IN (?)')
+
+    def test_different_queries_stay_apart(self):
+        self.assertNotEqual(
+            statement_shape('SELECT * FROM venue WHERE id = 1'),
+            statement_shape('SELECT * FROM artist WHERE id = 1'))
+
+
+class QueryCounterTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine('sqlite://')
+        self.app = Flask(__name__)
+        self.app.config['TESTING'] = True
+        QueryCounter(self.app)
+        engine = self.engine
+
+        @self.app.route('/rows/<int:count>')
+        def rows(count):
+            # One query per row: the N+1 pattern the counter catches.
+            with engine.connect() as connection:
+                for i in range(count):
+                    connection.execute(text('SELECT :i'), {'i': i})
+            return 'ok'
+
+        @self.app.route('/failing')
+        def failing():
+            with engine.connect() as connection:
+                for _ in range(3):
+                    try:
+                        connection.execute(text('SELECT * FROM missing'))
+                    except OperationalError:
+                        pass
+                started = connection.info.get('querycount_started', [])
+                return jsonify(pending=len(started))
+
+    def test_counts_statements(self):
+        res = self.app.test_client().get('/rows/3')
+        self.assertEqual(res.headers['X-Query-Count'], '3')
+        self.assertIn('db;dur=', res.headers['Server-Timing'])
+
+    def test_repeat_limit(self):
+        res = self.app.test_client().get('/rows/10')
+        self.assertEqual(res.status_code, 200)
+        with self.assertRaises(RepeatedQueryError):
+            self.app.test_client().get('/rows/11')
+
+    def test_repeats_only_logged_when_not_raising(self):
+        self.app.config['QUERYCOUNT_RAISE'] = False
+        with self.assertLogs(self.app.logger, 'WARNING') as logs:
+            res = self.app.test_client().get('/rows/11')
+        self.assertEqual(res.headers['X-Query-Count'], '11')
+        self.assertIn('ran 11 times', logs.output[0])
+
+    def test_failed_statements_release_their_timers(self):
+        res = self.app.test_client().get('/failing')
+        self.assertEqual(res.get_json(), {'pending': 0})
+        self.assertEqual(res.headers['X-Query-Count'], '3')
+
+
+class CopiesTestCase(unittest.TestCase):
+
+    def test_copies_match(self):
+        sources = {}
+        for path in COPIES:
+            full_path = os.path.join(PROJECTS, path)
+            if not os.path.exists(full_path):
+                self.skipTest('{} is not checked out'.format(path))
+            with open(full_path, encoding='utf-8') as source:
+                sources[path] = source.read()
+        for path in COPIES[1:]:
+            with self.subTest(path=path):
+                self.assertEqual(sources[path], sources[COPIES[0]],
+                                 'querycount.py copies differ')
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
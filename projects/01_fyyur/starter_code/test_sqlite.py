@@ -0,0 +1,420 @@
+"""Fyyur against an in-memory SQLite database.
+
+Checks that the app starts and serves its pages without a database server,
+with genres stored as JSON (see models.GenreList), in a fixed number of
+queries however much data there is. Also covers cursors, the show counters,
+bookings, imports, exports and the caches. Runs by default:
+
+    python test_sqlite.py
+
+It is skipped when the app was already imported against another database,
+e.g. alongside test_query_plans.py with FYYUR_TEST_DATABASE_URL set.
+"""
+import csv
+import io
+import json
+import os
+import re
+import sys
+import threading
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+
+if 'models' not in sys.modules and \
+        not os.environ.get('FYYUR_TEST_DATABASE_URL'):
+    os.environ['FYYUR_SQLITE'] = ':memory:'
+
+
+class SQLiteTestCase(unittest.TestCase):
+    """Pages, writes and caches on SQLite."""
+
+    @classmethod
+    def setUpClass(cls):
+        import app as fyyur
+        if fyyur.db.engine.dialect.name != 'sqlite':
+            raise unittest.SkipTest('the app is bound to {}'.format(
+                fyyur.db.engine.dialect.name))
+        cls.fyyur = fyyur
+        cls.app = fyyur.app
+        cls.db = fyyur.db
+        cls.app.config['TESTING'] = True
+
+    def setUp(self):
+        self.client = self.app.test_client
+        self.fyyur.init_db(drop=True)
+        self.fyyur.detail_cache.clear()
+        self.fyyur.genres.invalidate()
+        self.fyyur.search.mark_stale(self.fyyur.Venue)
+        self.fyyur.search.mark_stale(self.fyyur.Artist)
+        self.fyyur.matchmaking.mark_stale(self.fyyur.Venue)
+        self.fyyur.matchmaking.mark_stale(self.fyyur.Artist)
+
+        Venue, Artist, Show = \
+            self.fyyur.Venue, self.fyyur.Artist, self.fyyur.Show
+        self.jazz = Venue(name='Blue Room', city='San Francisco', state='CA',
+                          address='1 Main St', genres=['Jazz', 'Blues'],
+                          seeking_talent='true')
+        self.folk = Venue(name='Barn', city='Austin', state='TX',
+                          address='2 Main St', genres=['Folk'],
+                          seeking_talent='false')
+        self.artist = Artist(name='Trio', city='San Francisco', state='CA',
+                             genres=['Jazz'], seeking_venue='true')
+        self.db.session.add_all([self.jazz, self.folk, self.artist])
+        self.db.session.commit()
+        self.show = Show(venue_id=self.jazz.id, artist_id=self.artist.id,
+                         start_time=datetime.now() + timedelta(days=3))
+        self.db.session.add(self.show)
+        self.db.session.commit()
+
+    def tearDown(self):
+        self.db.session.remove()
+
+    def add_rows(self, count, venue_id, artist_id):
+        """Add ``count`` venues and artists, and shows linking them."""
+        Venue, Artist, Show = \
+            self.fyyur.Venue, self.fyyur.Artist, self.fyyur.Show
+        venues = [Venue(name='Venue {}'.format(i), city='City {}'.format(
+            i % 3), state='TX', address='Main St', genres=['Folk'])
+            for i in range(count)]
+        artists = [Artist(name='Artist {}'.format(i), city='Austin',
+                          state='TX', genres=['Folk']) for i in range(count)]
+        self.db.session.add_all(venues + artists)
+        self.db.session.commit()
+        for i, (venue, artist) in enumerate(zip(venues, artists)):
+            for days in (-i - 1, i + 10):
+                start_time = datetime.now() + timedelta(days=days)
+                self.db.session.add_all([
+                    Show(venue_id=venue_id, artist_id=artist.id,
+                         start_time=start_time),
+                    Show(venue_id=venue.id, artist_id=artist_id,
+                         start_time=start_time + timedelta(hours=4))])
+        self.db.session.commit()
+
+    def assertQueryCount(self, url, expected):
+        self.fyyur.detail_cache.clear()
+        self.fyyur.genres.invalidate()
+        res = self.client().get(url)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.headers['X-Query-Count'], str(expected))
+
+    def test_genres_round_trip(self):
+        venue = self.fyyur.Venue.query.get(self.jazz.id)
+        self.assertEqual(venue.genres, ['Jazz', 'Blues'])
+
+    def test_pages(self):
+        for url in ('/', '/venues', '/artists', '/shows',
+                    '/venues/{}'.format(self.jazz.id),
+                    '/artists/{}'.format(self.artist.id),
+                    '/venues/{}/edit'.format(self.jazz.id)):
+            with self.subTest(url=url):
+                self.assertEqual(self.client().get(url).status_code, 200)
+
+    def test_listing_query_counts(self):
+        venue_id, artist_id = self.jazz.id, self.artist.id
+        # One query for the page and one for the genre facet counts,
+        # however many rows there are.
+        for count in (0, 30):
+            self.add_rows(count, venue_id, artist_id)
+            for url in ('/venues', '/artists'):
+                with self.subTest(url=url, count=count):
+                    self.assertQueryCount(url, 2)
+
+    def test_shows_query_count(self):
+        venue_id, artist_id = self.jazz.id, self.artist.id
+        # Shows, venues and artists come from one joined query.
+        for count in (0, 30):
+            self.add_rows(count, venue_id, artist_id)
+            with self.subTest(count=count):
+                self.assertQueryCount('/shows', 1)
+
+    def test_detail_query_counts(self):
+        venue_id, artist_id = self.jazz.id, self.artist.id
+        # Past and upcoming shows come from one query with the entity;
+        # the detail cache is cleared, so every page is built.
+        for count in (0, 30):
+            self.add_rows(count, venue_id, artist_id)
+            for url in ('/venues/{}'.format(venue_id),
+                        '/artists/{}'.format(artist_id)):
+                with self.subTest(url=url, count=count):
+                    self.assertQueryCount(url, 1)
+
+    def test_per_page_out_of_range(self):
+        for url in ('/shows', '/venues', '/artists'):
+            for per_page in ('0', '-5', '100000'):
+                with self.subTest(url=url, per_page=per_page):
+                    res = self.client().get(url + '?per_page=' + per_page)
+                    self.assertEqual(res.status_code, 200)
+
+    def test_genre_filters(self):
+        res = self.client().get('/venues?genre=Jazz&genre=Blues')
+        self.assertIn(b'Blue Room', res.data)
+        self.assertNotIn(b'Barn', res.data)
+
+        res = self.client().get('/venues?genre=Jazz&genre=Folk&match=any')
+        self.assertIn(b'Blue Room', res.data)
+        self.assertIn(b'Barn', res.data)
+
+        with self.app.test_request_context():
+            self.assertEqual(
+                self.fyyur.genres.facet_counts(self.fyyur.Venue),
+                [{'genre': 'Blues', 'count': 1}, {'genre': 'Folk', 'count': 1},
+                 {'genre': 'Jazz', 'count': 1}])
+
+    def test_facet_counts_ignore_rolled_back_writes(self):
+        facet_counts = self.fyyur.genres.facet_counts
+        with self.app.test_request_context():
+            self.db.session.add(self.fyyur.Venue(
+                name='Zebra Hall', city='Austin', state='TX',
+                address='4 Main St', genres=['Rock']))
+            self.db.session.flush()
+            self.assertIn({'genre': 'Rock', 'count': 1},
+                          facet_counts(self.fyyur.Venue))
+            self.db.session.rollback()
+            self.assertNotIn({'genre': 'Rock', 'count': 1},
+                             facet_counts(self.fyyur.Venue))
+
+            self.db.session.add(self.fyyur.Venue(
+                name='Zebra Hall', city='Austin', state='TX',
+                address='4 Main St', genres=['Rock']))
+            self.db.session.commit()
+            self.assertIn({'genre': 'Rock', 'count': 1},
+                          facet_counts(self.fyyur.Venue))
+
+    def test_recommendations_etag_follows_content(self):
+        url = '/venues/{}/recommendations'.format(self.jazz.id)
+        artist_id = self.artist.id
+        res = self.client().get(url)
+        self.assertEqual([artist['id'] for artist in res.get_json()['data']],
+                         [artist_id])
+        etag = res.headers['ETag']
+        res = self.client().get(url, headers={'If-None-Match': etag})
+        self.assertEqual(res.status_code, 304)
+
+        # A write by another worker: this process's index isn't told, and
+        # picks it up once MATCHMAKING_INDEX_TTL has passed.
+        self.db.session.execute(self.fyyur.Artist.__table__.update().values(
+            seeking_venue='false'))
+        self.db.session.commit()
+        self.app.config['MATCHMAKING_INDEX_TTL'] = 0
+        try:
+            res = self.client().get(url, headers={'If-None-Match': etag})
+        finally:
+            self.app.config['MATCHMAKING_INDEX_TTL'] = 60
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.get_json()['data'], [])
+        self.assertNotEqual(res.headers['ETag'], etag)
+
+    def test_cursor_round_trip(self):
+        pagination = self.fyyur.pagination
+        start_time = datetime(2030, 5, 1, 20, 30)
+        token = pagination.encode_cursor([start_time, 7], pagination.PREV)
+        self.assertEqual(pagination.decode_cursor(token, 2),
+                         (pagination.PREV, [start_time, 7]))
+
+        # Page forward and back one venue at a time.
+        first = self.client().get('/venues?per_page=1').get_data(True)
+        next_cursor, = re.findall(r'cursor=([\w-]+)', first)
+        second = self.client().get(
+            '/venues?per_page=1&cursor=' + next_cursor).get_data(True)
+        names = [name for name in ('Blue Room', 'Barn') if name in first]
+        self.assertEqual(len(names), 1)
+        self.assertNotIn(names[0], second)
+        prev_cursor, = re.findall(r'cursor=([\w-]+)', second)
+        back = self.client().get(
+            '/venues?per_page=1&cursor=' + prev_cursor).get_data(True)
+        self.assertIn(names[0], back)
+
+    def test_tampered_cursor(self):
+        pagination = self.fyyur.pagination
+        for url, cursor in (
+                ('/venues', 'not-a-cursor'),
+                ('/venues', 'x' + pagination.encode_cursor([1])),
+                ('/venues', pagination.encode_cursor(['CA', 'Austin', 1],
+                                                     'up')),
+                ('/venues', pagination.encode_cursor([1, 2, 3, 4])),
+                ('/venues', pagination.encode_cursor([1, 2, 3])),
+                ('/artists', pagination.encode_cursor([[1]])),
+                ('/artists', pagination.encode_cursor(['1'])),
+                ('/artists', pagination.encode_cursor([True])),
+                ('/shows', pagination.encode_cursor([[1], 2])),
+                ('/shows', pagination.encode_cursor(['2030-05-01', 2])),
+                ('/shows', pagination.encode_cursor([{'dt': 5}, 2])),
+                ('/shows', pagination.encode_cursor([datetime.now(),
+                                                     'x']))):
+            with self.subTest(url=url, cursor=cursor):
+                res = self.client().get(url + '?cursor=' + cursor)
+                self.assertEqual(res.status_code, 400)
+
+    def test_counter_sweep(self):
+        Venue, Artist = self.fyyur.Venue, self.fyyur.Artist
+        venue_id, artist_id = self.jazz.id, self.artist.id
+        self.assertEqual(Venue.query.get(venue_id).upcoming_shows_count, 1)
+
+        # Nothing has started yet.
+        self.assertEqual(self.fyyur.counters.sweep(), 0)
+        self.assertEqual(Venue.query.get(venue_id).upcoming_shows_count, 1)
+
+        self.assertEqual(self.fyyur.counters.sweep(
+            datetime.now() + timedelta(days=4)), 1)
+        self.assertEqual(Venue.query.get(venue_id).upcoming_shows_count, 0)
+        self.assertEqual(Artist.query.get(artist_id).upcoming_shows_count, 0)
+        self.assertEqual(self.fyyur.counters.check(), [])
+
+    def test_past_shows_are_not_counted(self):
+        # init_db seeds the watermark, so a show that already started
+        # doesn't count as upcoming.
+        venue_id = self.folk.id
+        self.db.session.add(self.fyyur.Show(
+            venue_id=venue_id, artist_id=self.artist.id,
+            start_time=datetime.now() - timedelta(days=30)))
+        self.db.session.commit()
+        self.assertEqual(
+            self.fyyur.Venue.query.get(venue_id).upcoming_shows_count, 0)
+        self.assertEqual(self.fyyur.counters.check(), [])
+
+    def test_conflicting_show_is_not_created(self):
+        Show = self.fyyur.Show
+        start_time = self.show.start_time + timedelta(hours=1)
+        res = self.client().post('/shows/create', data={
+            'venue_id': self.folk.id, 'artist_id': self.artist.id,
+            'start_time': start_time.strftime('%Y-%m-%d %H:%M:%S')})
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(Show.query.count(), 1)
+
+        start_time += timedelta(days=1)
+        self.client().post('/shows/create', data={
+            'venue_id': self.folk.id, 'artist_id': self.artist.id,
+            'start_time': start_time.strftime('%Y-%m-%d %H:%M:%S')})
+        self.assertEqual(Show.query.count(), 2)
+
+    def test_import_rejects_conflicting_shows(self):
+        show_id, venue_id, artist_id = \
+            self.show.id, self.folk.id, self.artist.id
+        start_time = self.show.start_time.replace(microsecond=0)
+
+        def row(venue_id, start_time):
+            return {'venue_id': venue_id, 'artist_id': artist_id,
+                    'start_time': start_time.strftime('%Y-%m-%d %H:%M:%S')}
+
+        errors = []
+        with self.app.app_context():
+            inserted, rejected = self.fyyur.bulk_import.import_rows('shows', [
+                (1, row(venue_id, start_time + timedelta(hours=1))),
+                (2, row(venue_id, start_time + timedelta(days=1))),
+                (3, row(venue_id, start_time + timedelta(days=1, hours=1))),
+                (4, row(9999, start_time + timedelta(days=2))),
+            ], 100, on_error=lambda *error: errors.append(error))
+
+        self.assertEqual((inserted, rejected), (1, 3))
+        self.assertEqual(errors, [
+            (1, 'overlaps booked show {}'.format(show_id)),
+            (3, 'overlaps line 2'),
+            (4, 'unknown venue_id 9999'),
+        ])
+        self.assertEqual(self.fyyur.Show.query.count(), 2)
+
+    def test_import_rejects_json_lines_that_are_not_objects(self):
+        venue = json.dumps({'name': 'Attic', 'city': 'Austin', 'state': 'TX',
+                            'address': '3 Main St', 'genres': ['Folk'],
+                            'facebook_link': 'https://facebook.com/attic'})
+        stream = io.StringIO('\n'.join([venue, '[1, 2]', '"x"', '3',
+                                         venue]) + '\n')
+        errors = []
+        with self.app.app_context():
+            inserted, rejected = self.fyyur.bulk_import.import_rows(
+                'venues', self.fyyur.bulk_import.read_rows(stream, 'jsonl'),
+                100, on_error=lambda *error: errors.append(error))
+
+        self.assertEqual((inserted, rejected), (2, 3))
+        self.assertEqual(errors, [(line_num, 'expected a JSON object')
+                                  for line_num in (2, 3, 4)])
+        self.assertEqual(self.fyyur.Venue.query.count(), 4)
+
+    def test_export_row_counts(self):
+        for entity, count in (('venues', 2), ('artists', 1), ('shows', 1)):
+            with self.subTest(entity=entity):
+                res = self.client().get('/export/{}.ndjson'.format(entity))
+                self.assertEqual(len(res.get_data(True).splitlines()), count)
+
+                res = self.client().get('/export/{}.csv'.format(entity))
+                rows = list(csv.reader(io.StringIO(res.get_data(True))))
+                self.assertEqual(len(rows), count + 1)
+
+    def test_edits_invalidate_detail_pages(self):
+        venue_url = '/venues/{}'.format(self.jazz.id)
+        artist_url = '/artists/{}'.format(self.artist.id)
+        for url in (venue_url, artist_url):
+            self.assertIn(b'Trio', self.client().get(url).data)
+
+        # Each page also shows the name of the other side of its shows.
+        self.client().post(artist_url + '/edit', data={
+            'name': 'Quartet', 'city': 'San Francisco', 'state': 'CA',
+            'genres': 'Jazz', 'facebook_link': 'https://facebook.com/q'})
+        for url in (venue_url, artist_url):
+            with self.subTest(url=url):
+                self.assertIn(b'Quartet', self.client().get(url).data)
+
+        self.client().post(venue_url + '/edit', data={
+            'name': 'Green Room', 'city': 'San Francisco', 'state': 'CA',
+            'address': '1 Main St', 'genres': 'Jazz',
+            'facebook_link': 'https://facebook.com/g'})
+        for url in (venue_url, artist_url):
+            with self.subTest(url=url):
+                self.assertIn(b'Green Room', self.client().get(url).data)
+
+    def test_recommendation_index_rebuilds_outside_the_lock(self):
+        matchmaking = self.fyyur.matchmaking
+        build = matchmaking.MatchIndex.build
+        artist_id = self.artist.id
+        lock_free = []
+
+        def slow_build(index, rows):
+            # Another request can take the lock while this one rebuilds.
+            other = threading.Thread(target=lambda: lock_free.append(
+                matchmaking._lock.acquire(blocking=False) and
+                matchmaking._lock.release() is None))
+            other.start()
+            other.join()
+            if rows and hasattr(rows[0], 'seeking_venue'):
+                # Committed after the rebuild read its rows.
+                artist = self.fyyur.Artist.query.get(artist_id)
+                artist.seeking_venue = 'false'
+                self.db.session.commit()
+            build(index, rows)
+
+        url = '/venues/{}/recommendations'.format(self.jazz.id)
+        with mock.patch.object(matchmaking.MatchIndex, 'build', slow_build):
+            res = self.client().get(url)
+        self.assertEqual(lock_free, [True, True])
+        self.assertEqual(res.get_json()['data'], [])
+
+    def test_search(self):
+        res = self.client().post('/venues/search',
+                                 data={'search_term': 'blue'})
+        self.assertIn(b'Blue Room', res.data)
+        self.assertNotIn(b'Barn', res.data)
+
+    def test_search_ignores_rolled_back_writes(self):
+        search = self.fyyur.search
+        with self.app.test_request_context():
+            self.db.session.add(self.fyyur.Venue(
+                name='Zebra Hall', city='Austin', state='TX',
+                address='4 Main St', genres=['Rock']))
+            self.db.session.flush()
+            # Searching between the flush and the rollback mustn't leave
+            # the uncommitted venue in the fallback index.
+            search.search_venues('zebra')
+            self.db.session.rollback()
+            self.assertEqual(search.search_venues('zebra')['count'], 0)
+
+            self.db.session.add(self.fyyur.Venue(
+                name='Zebra Hall', city='Austin', state='TX',
+                address='4 Main St', genres=['Rock']))
+            self.db.session.commit()
+            self.assertEqual(search.search_venues('zebra')['count'], 1)
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
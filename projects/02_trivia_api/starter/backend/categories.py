@@ -0,0 +1,113 @@
+import threading
+import time
+
+from flask import jsonify
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session, object_session
+
+from models import db, Question, Category
+
+# Seconds before the registry reloads anyway, to pick up writes made by
+# other processes.
+REGISTRY_TTL = 300
+
+
+'''
+CategoryRegistry
+    the {id: type} category map, loaded once per process, so listing
+    endpoints don't query it
+
+    committed writes to categories bump the registry's version, and
+    committed writes to questions the version of the per-category question
+    counts; either is reloaded on its next use
+'''
+class CategoryRegistry(object):
+  def __init__(self, ttl=REGISTRY_TTL):
+    self.ttl = ttl
+    self._lock = threading.Lock()
+    self._versions = {'categories': 0, 'counts': 0}
+    # name -> (version, loaded at, value)
+    self._loaded = {}
+
+  def mark_stale(self, name):
+    self._versions[name] += 1
+
+  def _get(self, name, load):
+    loaded = self._loaded.get(name)
+    if loaded is None or loaded[0] != self._versions[name] or \
+        time.monotonic() - loaded[1] >= self.ttl:
+      with self._lock:
+        version = self._versions[name]
+        loaded = (version, time.monotonic(), load())
+        self._loaded[name] = loaded
+    return loaded[2]
+
+  def _load_categories(self):
+    return {category.id: category.type
+            for category in Category.query.order_by(Category.type)}
+
+  def _load_counts(self):
+    counts = dict.fromkeys(self.types(), 0)
+    for category_id, count in db.session.query(
+        Question.category, func.count(Question.id)).group_by(
+        Question.category):
+      # questions whose category isn't a category id aren't counted
+      try:
+        category_id = int(category_id)
+      except (TypeError, ValueError):
+        continue
+      if category_id in counts:
+        counts[category_id] += count
+    return counts
+
+  def types(self):
+    '''{category id: type}'''
+    return self._get('categories', self._load_categories)
+
+  def question_counts(self):
+    '''
+    {category id: number of questions}, from one GROUP BY query; questions
+    without a valid category id are left out.
+    '''
+    return self._get('counts', self._load_counts)
+
+
+category_registry = CategoryRegistry()
+
+
+def jsonify_with_categories(payload):
+  '''jsonify(payload), with a "categories" member from the registry.'''
+  return jsonify(dict(payload, categories=category_registry.types()))
+
+
+# Writes are noted on the session at flush and only mark the registry stale
+# once they commit, so that no request reloads in between and caches the
+# uncommitted state; a rollback discards them.
+
+def _pending(target):
+  return object_session(target).info.setdefault('category_registry', set())
+
+
+@event.listens_for(Category, 'after_insert')
+@event.listens_for(Category, 'after_update')
+@event.listens_for(Category, 'after_delete')
+def _category_changed(mapper, connection, target):
+  _pending(target).update(('categories', 'counts'))
+
+
+@event.listens_for(Question, 'after_insert')
+@event.listens_for(Question, 'after_update')
+@event.listens_for(Question, 'after_delete')
+def _question_changed(mapper, connection, target):
+  _pending(target).add('counts')
+
+
+@event.listens_for(Session, 'after_commit')
+def _mark_stale_on_commit(session):
+  for name in session.info.pop('category_registry', ()):
+    category_registry.mark_stale(name)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_on_rollback(session, previous_transaction):
+  session.info.pop('category_registry', None)
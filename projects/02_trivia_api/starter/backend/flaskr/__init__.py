@@ -1,31 +1,56 @@
-
 import os
 from flask import Flask, request, abort, jsonify
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
 import random
-from sqlalchemy import func
 
-from models import setup_db, Question, Category
+from categories import category_registry, jsonify_with_categories
+from models import setup_db, db_create_all, Question, Category
+from querycount import QueryCounter
+from quiz import next_question, question_pool
+from quiz_sessions import make_store
+from search import create_search_index, search_questions as find_questions
 
 QUESTIONS_PER_PAGE = 10
 
 # utility for paginating questions
 def paginate_questions(request, selection):
+    '''
+    Return the requested page of the ``selection`` query, formatted, and the
+    total number of questions it matches.
+
+    Only the page's rows are loaded, with LIMIT/OFFSET. The total comes from
+    a COUNT, which is skipped when the page itself shows where the selection
+    ends.
+    '''
     page = request.args.get('page', 1, type=int)
+    if page < 1:
+        return [], selection.order_by(None).count()
     start = (page - 1) * QUESTIONS_PER_PAGE
-    end = start + QUESTIONS_PER_PAGE
 
-    questions = [question.format() for question in selection]
-    current_questions = questions[start:end]
+    questions = selection.offset(start).limit(QUESTIONS_PER_PAGE).all()
+    if len(questions) < QUESTIONS_PER_PAGE and (questions or start == 0):
+        total = start + len(questions)
+    else:
+        total = selection.order_by(None).count()
 
-    return current_questions
+    return [question.format() for question in questions], total
 
 def create_app(test_config=None):
   # create and configure the app
   app = Flask(__name__)
+  if test_config:
+    app.config.from_mapping(test_config)
   setup_db(app)
   CORS(app)
+  QueryCounter(app)
+  quiz_sessions = make_store(app.config)
+
+  @app.cli.command('init-db')
+  def init_db():
+    '''Create the database tables and the search index.'''
+    db_create_all()
+    create_search_index()
   
   @app.route('/')
   def hello_world():
@@ -63,21 +88,20 @@ def create_app(test_config=None):
 
   @app.route('/questions')
   def retrieve_questions():
-     selection = Question.query.order_by(Question.id).all()
-     current_questions = paginate_questions(request, selection)
-     categories = Category.query.order_by(Category.type).all()
+     selection = Question.query.order_by(Question.id)
+     current_questions, total_questions = paginate_questions(request,
+                                                             selection)
      
      # no questions are found, abort with a 404 error.
      if len(current_questions) == 0:
       abort(404)
      
-     # return data to view
-     return jsonify({
+     # return data to view, with the cached categories
+     return jsonify_with_categories({
        'success': True,
        'questions': current_questions,
-       'total_questions': len(selection),
-       'current_category': None,
-       'categories': {category.id: category.type for category in categories}
+       'total_questions': total_questions,
+       'current_category': None
         })
 
   ''' 
@@ -99,15 +123,15 @@ def create_app(test_config=None):
     try:
       question.delete()
 
-      all_questions = Question.query.order_by(Question.id).all()
-      current_questions = paginate_questions(request, all_questions)
+      current_questions, total_questions = paginate_questions(
+        request, Question.query.order_by(Question.id))
   
       # return data to view
       return jsonify({
           'success': True,
           'deleted': question_id,
           'questions': current_questions,
-          'total_questions': len(all_questions)
+          'total_questions': total_questions
       })
     
     except Exception as e:
@@ -138,6 +162,14 @@ def create_app(test_config=None):
     if new_question is None or new_answer is None:
       abort(422)
 
+    # the category must be the id of an existing category
+    try:
+      new_category = int(new_category)
+    except (TypeError, ValueError):
+      abort(422)
+    if new_category not in category_registry.types():
+      abort(422)
+
     try:
       print("create_question")
        # create and insert new questions
@@ -145,8 +177,8 @@ def create_app(test_config=None):
                           difficulty=new_difficulty, category=new_category)
       question.insert()
 
-      selection = Question.query.order_by(Question.id).all()
-      current_questions = paginate_questions(request, selection)
+      current_questions, total_questions = paginate_questions(
+        request, Question.query.order_by(Question.id))
      
       # return data to view
       return jsonify({
@@ -154,7 +186,7 @@ def create_app(test_config=None):
         'created': question.id,
         'question_created': question.id,
         'questions': current_questions,
-        'total_questions': len(Question.query.all())
+        'total_questions': total_questions
       })
     except Exception as e:
         print(e)
@@ -169,28 +201,40 @@ def create_app(test_config=None):
   TEST: Search by any phrase. The questions list will update to include 
   only question that include that string within their question. 
   Try using the word "title" to start. 
+
+  Questions and answers are searched by word prefix and ranked by
+  relevance; category and difficulty optionally narrow the results.
   '''
   @app.route('/questions/search', methods=['POST'])
   def search_questions():
     # load the request body
-    body = request.get_json()
-    search_term = body.get('searchTerm', None)
+    body = request.get_json(silent=True) or {}
+    search_term = body.get('searchTerm') or ''
+
+    # optional filters; a category of 0 means all categories
+    try:
+      category = int(body.get('category') or 0) or None
+      difficulty = body.get('difficulty')
+      difficulty = None if difficulty is None else int(difficulty)
+    except (TypeError, ValueError):
+      abort(400)
 
-    search_results = Question.query.filter(Question.question.ilike(f'%{search_term}%')).all()
+    # rank and paginate in the database, or in the in-memory index
+    page = max(request.args.get('page', 1, type=int), 1)
+    questions, total_questions = find_questions(
+      search_term, category, difficulty,
+      start=(page - 1) * QUESTIONS_PER_PAGE, limit=QUESTIONS_PER_PAGE)
 
     # 404 if no results found
-    if not search_results:
+    if not total_questions:
       abort(404)
 
-    # paginate the selection
-    paginated = paginate_questions(request, search_results)
-
     # return data to view
     return jsonify({
       'success': True,
-      'questions': paginated,
-      'total_questions': len(search_results),
-      'current_category': None
+      'questions': [question.format() for question in questions],
+      'total_questions': total_questions,
+      'current_category': category
     }) 
 
   '''
@@ -199,16 +243,14 @@ def create_app(test_config=None):
   '''
   @app.route('/categories')
   def get_categories():
-    categories = Category.query.order_by(Category.type).all()
-    
     # abort 404 if no categories found
-    if len(categories) == 0:
+    if not category_registry.types():
         abort(404)
     
-    # return data to view
-    return jsonify({
+    # return data to view, with the cached categories
+    return jsonify_with_categories({
       'success': True,
-      'categories': {category.id: category.type for category in categories}
+      'question_counts': category_registry.question_counts()
        })
 
   '''
@@ -227,16 +269,17 @@ def create_app(test_config=None):
 
     try:
       # get the category by id
-      questions = Question.query.filter(Question.category == str(category_id)).all()
+      questions = Question.query.filter(
+        Question.category == str(category_id)).order_by(Question.id)
 
       # paginate the selection
-      paginated = paginate_questions(request, questions)
+      paginated, total_questions = paginate_questions(request, questions)
 
       # return data to view
       return jsonify({
         'success': True,
         'questions': paginated,
-        'total_questions': len(questions),
+        'total_questions': total_questions,
         'current_category': category_id
       })
     except Exception as e:
@@ -274,20 +317,16 @@ def create_app(test_config=None):
     #Read the category for quizing  
     quiz_category = body.get('quiz_category')
 
-    # convert category id to integer
+    # convert category id to integer; 0 means all categories
     cat_id = int(quiz_category['id'])
-    if cat_id == 0:
-      questions_by_category = Question.query.order_by(func.random())
-    else:
-        #Use the category that was sent by user
-        questions_by_category = Question.query.filter(Question.category == cat_id).order_by(func.random())
-    
-    #Check to see if there is any questions for the selected category
-    if not questions_by_category.all():
-        abort(404)
-    else:
-      #Filter out all the questions that were previously played out
-      quiz_on_question = questions_by_category.filter(Question.id.notin_(previous_questions)).first()
+    try:
+      # a random question that was not previously played, picked from the
+      # in-memory question ids instead of sorting the table
+      quiz_on_question = next_question(str(cat_id) if cat_id else None,
+                                       previous_questions)
+    except LookupError:
+      # there are no questions for the selected category
+      abort(404)
     
     # User already played all the question in this category and hence return done
     if quiz_on_question is None:
@@ -300,6 +339,65 @@ def create_app(test_config=None):
         'question': quiz_on_question.format()
     })
 
+  '''
+  Quiz sessions. POST /quizzes deals a shuffled deck of the category's
+  question ids and returns its quiz_id. Each POST /quizzes/<quiz_id>/next
+  takes the next question off the deck, so clients don't send
+  previous_questions. /play above stays for older clients.
+  '''
+  @app.route('/quizzes', methods=['POST'])
+  def create_quiz():
+    body = request.get_json(silent=True)
+    try:
+      cat_id = int(body['quiz_category']['id'])
+    except (KeyError, TypeError, ValueError):
+      abort(400)
+
+    deck = list(question_pool.ids(str(cat_id) if cat_id else None))
+    # there are no questions for the selected category
+    if not deck:
+      abort(404)
+    random.shuffle(deck)
+
+    return jsonify({
+      'success': True,
+      'quiz_id': quiz_sessions.create(deck),
+      'total_questions': len(deck)
+    }), 201
+
+  @app.route('/quizzes/<quiz_id>/next', methods=['POST'])
+  def next_quiz_question(quiz_id):
+    while True:
+      try:
+        question_id, remaining = quiz_sessions.pop(quiz_id)
+      except KeyError:
+        # unknown or expired quiz
+        abort(404)
+
+      # the deck is used up, same as /play once every question was played
+      if question_id is None:
+        return jsonify({
+          'success': True
+        })
+
+      # skip questions deleted since the deck was dealt
+      question = Question.query.get(question_id)
+      if question is not None:
+        return jsonify({
+          'success': True,
+          'question': question.format(),
+          'remaining': remaining
+        })
+
+  @app.route('/quizzes/<quiz_id>', methods=['DELETE'])
+  def delete_quiz(quiz_id):
+    if not quiz_sessions.delete(quiz_id):
+      abort(404)
+    return jsonify({
+      'success': True,
+      'deleted': quiz_id
+    })
+
 
   '''
   Create error handlers for all expected errors 
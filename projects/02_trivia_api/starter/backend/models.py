@@ -17,6 +17,14 @@ def setup_db(app, database_path=database_path):
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
     db.app = app
     db.init_app(app)
+
+'''
+db_create_all()
+    creates any tables that don't exist yet
+    run it once with `flask init-db`; setup_db doesn't, so starting an app
+    costs no schema round trips
+'''
+def db_create_all():
     db.create_all()
 
 '''
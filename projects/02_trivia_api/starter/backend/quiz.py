@@ -0,0 +1,127 @@
+import random
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from models import db, Question
+
+# Seconds before the ids are reloaded anyway, to pick up questions written
+# by other processes.
+POOL_TTL = 60
+# Random draws tried before falling back to listing the unplayed ids.
+SAMPLE_ATTEMPTS = 8
+
+
+'''
+QuestionPool
+    question ids by category, held in memory so that /play can pick a
+    random question without sorting the questions table
+
+    the ids are loaded with one query, and reloaded on the next use after a
+    commit that inserted, updated or deleted a question through the ORM, or
+    after POOL_TTL seconds
+'''
+class QuestionPool(object):
+  def __init__(self, ttl=POOL_TTL):
+    self.ttl = ttl
+    self._lock = threading.Lock()
+    self._by_category = None
+    self._version = 0
+    self._loaded_version = None
+    self._loaded_at = 0
+
+  def mark_stale(self):
+    self._version += 1
+
+  def _fresh(self):
+    return self._by_category is not None and \
+      self._loaded_version == self._version and \
+      time.monotonic() - self._loaded_at < self.ttl
+
+  def ids(self, category=None):
+    '''Tuple of the question ids in ``category``, or of all questions.'''
+    if not self._fresh():
+      with self._lock:
+        if not self._fresh():
+          self._load()
+    return self._by_category.get(category, ())
+
+  def _load(self):
+    version = self._version
+    by_category = {None: []}
+    for question_id, category in db.session.query(Question.id,
+                                                  Question.category):
+      by_category[None].append(question_id)
+      by_category.setdefault(str(category), []).append(question_id)
+    self._by_category = {category: tuple(ids)
+                         for category, ids in by_category.items()}
+    self._loaded_version = version
+    self._loaded_at = time.monotonic()
+
+  def choose(self, category=None, previous=(), rng=random):
+    '''
+    A question id from ``category`` that is not in ``previous``, chosen
+    uniformly, or None when all of them have been played. Raises
+    LookupError when the category has no questions.
+
+    While most of the category is unplayed a few random draws find an id,
+    so the cost doesn't grow with the size of the category.
+    '''
+    ids = self.ids(category)
+    if not ids:
+      raise LookupError(category)
+    played = set(previous)
+    for _ in range(SAMPLE_ATTEMPTS):
+      question_id = ids[rng.randrange(len(ids))]
+      if question_id not in played:
+        return question_id
+    remaining = [question_id for question_id in ids
+                 if question_id not in played]
+    return rng.choice(remaining) if remaining else None
+
+
+question_pool = QuestionPool()
+
+
+def next_question(category=None, previous=()):
+  '''
+  A random unplayed Question from ``category`` (all categories when None),
+  or None when every question has been played. Raises LookupError when the
+  category has no questions.
+  '''
+  skipped = set(previous)
+  while True:
+    question_id = question_pool.choose(category, skipped)
+    if question_id is None:
+      return None
+    question = Question.query.get(question_id)
+    if question is not None:
+      return question
+    # Deleted by another process since the ids were loaded; reload them and
+    # draw again, without this id.
+    question_pool.mark_stale()
+    skipped.add(question_id)
+
+
+# Writes are noted on the session at flush and only mark the pool stale once
+# they commit, so that no request reloads the ids in between and caches the
+# uncommitted state; a rollback discards them.
+
+@event.listens_for(Question, 'after_insert')
+@event.listens_for(Question, 'after_update')
+@event.listens_for(Question, 'after_delete')
+def _question_changed(mapper, connection, target):
+  object_session(target).info['quiz_pool_stale'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _mark_stale_on_commit(session):
+  if session.info.pop('quiz_pool_stale', False):
+    question_pool.mark_stale()
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_on_rollback(session, previous_transaction):
+  session.info.pop('quiz_pool_stale', None)
@@ -0,0 +1,192 @@
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Seconds a quiz session lives after its last use.
+SESSION_TTL = 30 * 60
+# Sessions a MemoryDeckStore holds before it evicts the least recently used.
+MAX_SESSIONS = 10000
+
+
+'''
+MemoryDeckStore
+    quiz decks in this process's memory; sessions expire SESSION_TTL seconds
+    after their last use, and past MAX_SESSIONS the least recently used one
+    is evicted, so clients starting quizzes can't exhaust the worker's memory
+
+    use it with a single worker process, or with sticky sessions
+'''
+class MemoryDeckStore(object):
+  def __init__(self, ttl=SESSION_TTL, max_sessions=MAX_SESSIONS):
+    self.ttl = ttl
+    self.max_sessions = max_sessions
+    self._lock = threading.Lock()
+    # session id -> (expires at, deck); least recently used first
+    self._sessions = OrderedDict()
+
+  def _evict(self, now):
+    while self._sessions:
+      session_id, (expires_at, _) = next(iter(self._sessions.items()))
+      if expires_at > now:
+        break
+      del self._sessions[session_id]
+
+  def create(self, deck):
+    session_id = secrets.token_urlsafe(16)
+    with self._lock:
+      now = time.monotonic()
+      self._evict(now)
+      while len(self._sessions) >= self.max_sessions:
+        self._sessions.popitem(last=False)
+      self._sessions[session_id] = (now + self.ttl, list(deck))
+    return session_id
+
+  def pop(self, session_id):
+    '''
+    The next question id of the deck and how many are left after it; the id
+    is None when the deck is used up. Raises KeyError for an unknown or
+    expired session.
+    '''
+    with self._lock:
+      now = time.monotonic()
+      self._evict(now)
+      _, deck = self._sessions.pop(session_id)
+      self._sessions[session_id] = (now + self.ttl, deck)
+      return (deck.pop() if deck else None), len(deck)
+
+  def delete(self, session_id):
+    with self._lock:
+      return self._sessions.pop(session_id, None) is not None
+
+
+'''
+SQLiteDeckStore
+    quiz decks in a SQLite file that every worker process on the host
+    shares; one row per card, so taking the next card doesn't read the
+    whole deck
+'''
+class SQLiteDeckStore(object):
+  SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS quiz_session (
+      id TEXT PRIMARY KEY,
+      next_position INTEGER NOT NULL,
+      size INTEGER NOT NULL,
+      expires_at REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS ix_quiz_session_expires_at
+      ON quiz_session (expires_at);
+    CREATE TABLE IF NOT EXISTS quiz_card (
+      session_id TEXT NOT NULL,
+      position INTEGER NOT NULL,
+      question_id INTEGER NOT NULL,
+      PRIMARY KEY (session_id, position)
+    );
+  '''
+
+  def __init__(self, path, ttl=SESSION_TTL):
+    self.path = path
+    self.ttl = ttl
+    connection = sqlite3.connect(path, timeout=10)
+    try:
+      # WAL lets workers read while another one writes.
+      connection.execute('PRAGMA journal_mode=WAL')
+      connection.executescript(self.SCHEMA)
+    finally:
+      connection.close()
+
+  def _connect(self):
+    return _Transaction(sqlite3.connect(self.path, timeout=10,
+                                        isolation_level=None))
+
+  def _evict(self, connection, now):
+    expired = [row[0] for row in connection.execute(
+      'SELECT id FROM quiz_session WHERE expires_at <= ?', (now,))]
+    for session_id in expired:
+      self._remove(connection, session_id)
+
+  def _remove(self, connection, session_id):
+    connection.execute('DELETE FROM quiz_card WHERE session_id = ?',
+                       (session_id,))
+    return connection.execute('DELETE FROM quiz_session WHERE id = ?',
+                              (session_id,)).rowcount
+
+  def create(self, deck):
+    session_id = secrets.token_urlsafe(16)
+    now = time.time()
+    with self._connect() as connection:
+      self._evict(connection, now)
+      connection.execute(
+        'INSERT INTO quiz_session (id, next_position, size, expires_at) '
+        'VALUES (?, 0, ?, ?)', (session_id, len(deck), now + self.ttl))
+      connection.executemany(
+        'INSERT INTO quiz_card (session_id, position, question_id) '
+        'VALUES (?, ?, ?)',
+        [(session_id, position, question_id)
+         for position, question_id in enumerate(deck)])
+    return session_id
+
+  def pop(self, session_id):
+    now = time.time()
+    with self._connect() as connection:
+      row = connection.execute(
+        'SELECT next_position, size FROM quiz_session '
+        'WHERE id = ? AND expires_at > ?', (session_id, now)).fetchone()
+      if row is None:
+        raise KeyError(session_id)
+      position, size = row
+      if position >= size:
+        question_id = None
+      else:
+        question_id = connection.execute(
+          'SELECT question_id FROM quiz_card '
+          'WHERE session_id = ? AND position = ?',
+          (session_id, position)).fetchone()[0]
+        connection.execute(
+          'DELETE FROM quiz_card WHERE session_id = ? AND position = ?',
+          (session_id, position))
+        position += 1
+      connection.execute(
+        'UPDATE quiz_session SET next_position = ?, expires_at = ? '
+        'WHERE id = ?', (position, now + self.ttl, session_id))
+    return question_id, size - position
+
+  def delete(self, session_id):
+    with self._connect() as connection:
+      return self._remove(connection, session_id) > 0
+
+
+class _Transaction(object):
+  '''One write transaction on ``connection``, closed afterwards.'''
+  def __init__(self, connection):
+    self.connection = connection
+
+  def __enter__(self):
+    self.connection.execute('BEGIN IMMEDIATE')
+    return self.connection
+
+  def __exit__(self, exc_type, exc, tb):
+    try:
+      self.connection.execute('COMMIT' if exc_type is None else 'ROLLBACK')
+    finally:
+      self.connection.close()
+
+
+'''
+make_store(config)
+    the deck store named by QUIZ_SESSION_STORE ('memory' or 'sqlite'), with
+    QUIZ_SESSION_TTL and, for memory, QUIZ_SESSION_MAX sessions or, for
+    sqlite, the QUIZ_SESSION_DB file
+'''
+def make_store(config):
+  ttl = config.get('QUIZ_SESSION_TTL', SESSION_TTL)
+  backend = config.get('QUIZ_SESSION_STORE', 'memory')
+  if backend == 'memory':
+    return MemoryDeckStore(ttl, config.get('QUIZ_SESSION_MAX', MAX_SESSIONS))
+  if backend == 'sqlite':
+    path = config.get('QUIZ_SESSION_DB') or os.path.join(
+      os.path.dirname(os.path.abspath(__file__)), 'quiz_sessions.db')
+    return SQLiteDeckStore(path, ttl)
+  raise ValueError('Unknown QUIZ_SESSION_STORE: {!r}'.format(backend))
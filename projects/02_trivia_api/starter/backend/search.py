@@ -0,0 +1,253 @@
+import bisect
+import math
+import re
+import threading
+
+from sqlalchemy import event, func, text
+from sqlalchemy.orm import Session, object_session
+
+from models import db, Question
+
+# Postgres text search configuration: no stemming and no stop words, so
+# that Postgres and the in-memory index match the same questions.
+SEARCH_CONFIG = 'simple'
+# BM25 parameters of the in-memory index.
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+WORD = re.compile(r'[^\W_]+')
+
+
+def tokenize(text):
+  '''The lower-cased words of ``text``.'''
+  return WORD.findall((text or '').lower())
+
+
+'''
+create_search_index()
+    creates the GIN index over the questions' and answers' words on Postgres
+    run it once with `flask init-db`; Postgres keeps it current on every
+    insert, update and delete
+'''
+def create_search_index():
+  if db.engine.dialect.name != 'postgresql':
+    return
+  with db.engine.begin() as connection:
+    connection.execute(text(
+      "CREATE INDEX IF NOT EXISTS ix_questions_search ON questions "
+      "USING gin (to_tsvector('{}', coalesce(question, '') || ' ' || "
+      "coalesce(answer, '')))".format(SEARCH_CONFIG)))
+
+
+def _document():
+  # Must be the expression of ix_questions_search, or the index isn't used.
+  return func.to_tsvector(SEARCH_CONFIG,
+                          func.coalesce(Question.question, '') + ' ' +
+                          func.coalesce(Question.answer, ''))
+
+
+def _filtered(query, category, difficulty):
+  if category is not None:
+    query = query.filter(Question.category == str(category))
+  if difficulty is not None:
+    query = query.filter(Question.difficulty == difficulty)
+  return query
+
+
+'''
+InvertedIndex
+    word -> {question id: occurrences} over the questions and answers, for
+    databases without full text search, e.g. SQLite
+
+    built with one query on first use and then updated question by question
+    once the ORM's inserts, updates and deletes commit, so a search costs
+    time in the number of matching questions rather than in the size of the
+    table
+'''
+class InvertedIndex(object):
+  def __init__(self):
+    self._lock = threading.Lock()
+    self._postings = None
+    # question id -> (category, difficulty, number of words, distinct words)
+    self._documents = {}
+    # the indexed words, sorted for prefix lookups
+    self._words = []
+    self._total_length = 0
+
+  @property
+  def loaded(self):
+    return self._postings is not None
+
+  def _load(self):
+    self._postings = {}
+    for question in db.session.query(Question.id, Question.question,
+                                     Question.answer, Question.category,
+                                     Question.difficulty):
+      self._add(*question)
+
+  def _add(self, question_id, question, answer, category, difficulty):
+    self._remove(question_id)
+    words = tokenize(question) + tokenize(answer)
+    for word in words:
+      postings = self._postings.get(word)
+      if postings is None:
+        postings = self._postings[word] = {}
+        bisect.insort(self._words, word)
+      postings[question_id] = postings.get(question_id, 0) + 1
+    self._documents[question_id] = (
+      None if category is None else str(category), difficulty, len(words),
+      frozenset(words))
+    self._total_length += len(words)
+
+  def _remove(self, question_id):
+    document = self._documents.pop(question_id, None)
+    if document is None:
+      return
+    self._total_length -= document[2]
+    for word in document[3]:
+      self._postings[word].pop(question_id, None)
+
+  def add(self, question_id, question, answer, category, difficulty):
+    '''Index a question, replacing what was indexed for its id.'''
+    with self._lock:
+      if self.loaded:
+        self._add(question_id, question, answer, category, difficulty)
+
+  def remove(self, question_id):
+    with self._lock:
+      if self.loaded:
+        self._remove(question_id)
+
+  def _expand(self, prefix):
+    start = bisect.bisect_left(self._words, prefix)
+    for word in self._words[start:]:
+      if not word.startswith(prefix):
+        break
+      if self._postings[word]:
+        yield word
+
+  def search(self, terms, category=None, difficulty=None):
+    '''
+    The ids of the questions containing a word starting with each of
+    ``terms``, best match first (BM25, ties by id).
+    '''
+    with self._lock:
+      if not self.loaded:
+        self._load()
+      if not self._documents:
+        return []
+      average_length = self._total_length / len(self._documents) or 1
+      scores = None
+      for term in set(terms):
+        term_scores = {}
+        for word in self._expand(term):
+          postings = self._postings[word]
+          idf = math.log(1 + (len(self._documents) - len(postings) + 0.5) /
+                         (len(postings) + 0.5))
+          for question_id, count in postings.items():
+            length = self._documents[question_id][2]
+            term_scores[question_id] = term_scores.get(question_id, 0) + \
+              idf * count * (BM25_K1 + 1) / (count + BM25_K1 * (
+                1 - BM25_B + BM25_B * length / average_length))
+        if scores is None:
+          scores = term_scores
+        else:
+          scores = {question_id: score + term_scores[question_id]
+                    for question_id, score in scores.items()
+                    if question_id in term_scores}
+        if not scores:
+          return []
+      category = None if category is None else str(category)
+      return sorted((question_id for question_id in scores
+                     if (category is None or
+                         self._documents[question_id][0] == category) and
+                     (difficulty is None or
+                      self._documents[question_id][1] == difficulty)),
+                    key=lambda question_id: (-scores[question_id],
+                                             question_id))
+
+
+question_index = InvertedIndex()
+
+
+def _search_sql(terms, category, difficulty, start, limit):
+  query = _filtered(Question.query, category, difficulty)
+  order = [Question.id]
+  if terms:
+    document = _document()
+    # every term, each matching as a word prefix
+    tsquery = func.to_tsquery(SEARCH_CONFIG,
+                              ' & '.join(term + ':*' for term in terms))
+    query = query.filter(document.op('@@')(tsquery))
+    order = [func.ts_rank(document, tsquery).desc(), Question.id]
+
+  questions = query.order_by(*order).offset(start).limit(limit).all()
+  if len(questions) < limit and (questions or start == 0):
+    total = start + len(questions)
+  else:
+    total = query.order_by(None).count()
+  return questions, total
+
+
+def _search_index(terms, category, difficulty, start, limit):
+  ids = question_index.search(terms, category, difficulty)
+  if ids:
+    # drop questions another process deleted since they were indexed
+    existing = {question_id for question_id, in db.session.query(
+      Question.id).filter(Question.id.in_(ids))}
+    ids = [question_id for question_id in ids if question_id in existing]
+  page = ids[start:start + limit]
+  questions = {question.id: question for question in
+               Question.query.filter(Question.id.in_(page))} if page else {}
+  return [questions[question_id] for question_id in page
+          if question_id in questions], len(ids)
+
+
+def search_questions(search_term, category=None, difficulty=None, start=0,
+                     limit=10):
+  '''
+  The questions whose question or answer contains a word starting with each
+  word of ``search_term``, most relevant first, from ``start`` up to
+  ``limit`` of them, and how many match in total. With no words in
+  ``search_term`` every question matches, in id order.
+
+  Postgres ranks with ts_rank over the ix_questions_search index; other
+  databases use the in-memory InvertedIndex.
+  '''
+  terms = tokenize(search_term)
+  if db.engine.dialect.name == 'postgresql' or not terms:
+    return _search_sql(terms, category, difficulty, start, limit)
+  return _search_index(terms, category, difficulty, start, limit)
+
+
+# Changes are queued on the session at flush and applied to the index once
+# they commit; a rollback discards them.
+
+def _pending(target):
+  return object_session(target).info.setdefault('question_index', [])
+
+
+@event.listens_for(Question, 'after_insert')
+@event.listens_for(Question, 'after_update')
+def _question_written(mapper, connection, target):
+  _pending(target).append((target.id, (
+    target.question, target.answer, target.category, target.difficulty)))
+
+
+@event.listens_for(Question, 'after_delete')
+def _question_deleted(mapper, connection, target):
+  _pending(target).append((target.id, None))
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_pending(session):
+  for question_id, values in session.info.pop('question_index', ()):
+    if values is None:
+      question_index.remove(question_id)
+    else:
+      question_index.add(question_id, *values)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_pending(session, previous_transaction):
+  session.info.pop('question_index', None)
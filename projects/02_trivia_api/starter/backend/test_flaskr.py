@@ -1,9 +1,14 @@
 import os
+import tempfile
 import unittest
 import json
+from unittest import mock
 from flask_sqlalchemy import SQLAlchemy
 from flaskr import create_app
-from models import setup_db, Question, Category
+from models import setup_db, db, Question, Category
+from categories import category_registry
+from quiz import next_question, question_pool
+from search import question_index as index, _search_index
 from sqlalchemy import func
 
 
@@ -12,7 +17,7 @@ class TriviaTestCase(unittest.TestCase):
 
     def setUp(self):
         """Define test variables and initialize app."""
-        self.app = create_app()
+        self.app = create_app({'TESTING': True})
         self.client = self.app.test_client
         self.database_name = "trivia_test"
         self.database_path = "postgres://{}/{}".format('localhost:5432', self.database_name)
@@ -43,6 +48,16 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(len(data['questions']), 10)
         self.assertEqual(len(data['categories']), 6)
 
+    def test_query_count_header(self):
+        res = self.client().get('/questions')
+
+        self.assertEqual(res.status_code, 200)
+        # a page of questions and their total; categories are cached
+        self.client().get('/categories')
+        res = self.client().get('/questions')
+        self.assertEqual(res.headers['X-Query-Count'], '2')
+        self.assertIn('db;dur=', res.headers['Server-Timing'])
+
     def test_404_sent_requesting_questions_beyond_valid_page(self):
         res = self.client().get('/questions?page=1000', json={'rating': 1})
         data = json.loads(res.data)
@@ -51,6 +66,16 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['success'], False)
         self.assertEqual(data['message'], 'resource not found')
 
+    def test_get_last_page_of_questions(self):
+        total = Question.query.count()
+        last_page = (total - 1) // 10 + 1
+        res = self.client().get('/questions?page={}'.format(last_page))
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['total_questions'], total)
+        self.assertEqual(len(data['questions']), total - (last_page - 1) * 10)
+
     def test_get_categories(self):
         res = self.client().get('/categories')
         data = json.loads(res.data)
@@ -58,6 +83,33 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(res.status_code, 200)
         self.assertEqual(data['success'], True)
         self.assertTrue(len(data['categories']))
+        self.assertEqual(sorted(data['question_counts']),
+                         sorted(data['categories']))
+        self.assertEqual(sum(data['question_counts'].values()),
+                         Question.query.count())
+
+    def test_question_counts_follow_writes(self):
+        self.client().get('/categories')
+        question = Question(question='counted', answer='answer',
+                            difficulty=1, category=1)
+        question.insert()
+        data = json.loads(self.client().get('/categories').data)
+        question.delete()
+
+        self.assertEqual(sum(data['question_counts'].values()),
+                         Question.query.count() + 1)
+
+    def test_question_counts_ignore_rolled_back_writes(self):
+        with self.app.app_context():
+            counts = dict(category_registry.question_counts())
+            db.session.add(Question(question='rolled back', answer='answer',
+                                    difficulty=1, category=1))
+            db.session.flush()
+            # another request reloading now must not see the insert...
+            self.assertEqual(category_registry.question_counts(), counts)
+            db.session.rollback()
+            # ...nor cache it after the rollback
+            self.assertEqual(category_registry.question_counts(), counts)
 
     def test_404_sent_requesting_non_exist_category(self):
         res = self.client().get('/categories/9999', json={'rating': 1})
@@ -140,6 +192,17 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data["success"], False)
         self.assertEqual(data["message"], "unprocessable")
     
+    def test_422_unknown_category_create_question(self):
+        for category in ('science', 9999, None):
+            with self.subTest(category=category):
+                res = self.client().post('/questions', json={
+                    'question': 'Which category?', 'answer': 'none',
+                    'difficulty': 1, 'category': category})
+                data = json.loads(res.data)
+
+                self.assertEqual(res.status_code, 422)
+                self.assertEqual(data["message"], "unprocessable")
+
     def test_search_questions(self):
         res = self.client().post('/questions/search', json={'searchTerm': 'And'})
         data = json.loads(res.data)
@@ -149,6 +212,102 @@ class TriviaTestCase(unittest.TestCase):
         self.assertIsNotNone(data['questions'],)
         self.assertIsNotNone(data['total_questions'])
 
+    def test_search_matches_answers_by_word_prefix(self):
+        question = Question(question='Which city lies on the Yamuna?',
+                            answer='Agrabah', difficulty=1, category=3)
+        question.insert()
+        res = self.client().post('/questions/search',
+                                 json={'searchTerm': 'AGRA'})
+        data = json.loads(res.data)
+        question.delete()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(question.id,
+                      [found['id'] for found in data['questions']])
+
+    def test_search_ranks_best_match_first(self):
+        best = Question(question='Zebu zebu zebu?', answer='zebu',
+                        difficulty=1, category=1)
+        other = Question(question='Is a zebu a cow?', answer='yes',
+                         difficulty=1, category=1)
+        best.insert()
+        other.insert()
+        res = self.client().post('/questions/search',
+                                 json={'searchTerm': 'zebu'})
+        data = json.loads(res.data)
+        best.delete()
+        other.delete()
+
+        self.assertEqual([found['id'] for found in data['questions']],
+                         [best.id, other.id])
+
+    def test_search_filters_by_category_and_difficulty(self):
+        res = self.client().post('/questions/search', json={
+            'searchTerm': '', 'category': 3, 'difficulty': 2})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['current_category'], 3)
+        self.assertEqual(data['total_questions'], Question.query.filter(
+            Question.category == '3', Question.difficulty == 2).count())
+        for found in data['questions']:
+            self.assertEqual(str(found['category']), '3')
+            self.assertEqual(found['difficulty'], 2)
+
+    def test_400_bad_search_filter(self):
+        res = self.client().post('/questions/search', json={
+            'searchTerm': 'what', 'difficulty': 'hard'})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(data['message'], 'bad request')
+
+    def test_inverted_index_matches_database_search(self):
+        with self.app.app_context():
+            for term in ('what', 'india', 'the ti', 'what is'):
+                res = self.client().post('/questions/search?page=1',
+                                         json={'searchTerm': term})
+                total = json.loads(res.data)['total_questions']
+                with self.subTest(term=term):
+                    self.assertEqual(len(index.search(term.split())), total)
+
+            # kept current by inserts and deletes
+            question = Question(question='Where do quokkas live?',
+                                answer='Rottnest', difficulty=1, category=3)
+            question.insert()
+            self.assertEqual(index.search(['quokka'], category=3),
+                             [question.id])
+            self.assertEqual(index.search(['quokka'], difficulty=2), [])
+            question.delete()
+            self.assertEqual(index.search(['quokka']), [])
+
+    def test_inverted_index_ignores_rolled_back_writes(self):
+        with self.app.app_context():
+            index.search(['warm'])
+            db.session.add(Question(question='Where do wombats live?',
+                                    answer='Tasmania', difficulty=1,
+                                    category=3))
+            db.session.flush()
+            db.session.rollback()
+            self.assertEqual(index.search(['wombat']), [])
+
+            question = Question(question='Where do wombats live?',
+                                answer='Tasmania', difficulty=1, category=3)
+            question.insert()
+            question_id = question.id
+            db.session.delete(question)
+            db.session.flush()
+            db.session.rollback()
+            self.assertEqual(index.search(['wombat']), [question_id])
+
+            # deleted behind the ORM's back, e.g. by another process
+            db.session.execute(Question.__table__.delete().where(
+                Question.id == question_id))
+            db.session.commit()
+            self.assertEqual(_search_index(['wombat'], None, None, 0, 10),
+                             ([], 0))
+            index.remove(question_id)
+
     def test_404_missing_search_question(self):
         res = self.client().post('/questions/search', json={'searchTerm': 'yak'})
         data = json.loads(res.data)
@@ -188,6 +347,139 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(res.status_code, 200)
         self.assertTrue(data['success'])
         self.assertTrue(data['question'])
+        self.assertEqual(str(data['question']['category']), '2')
+        self.assertNotIn(data['question']['id'], [14, 13, 15])
+
+    def test_question_pool_reloads_only_after_commit(self):
+        with self.app.app_context():
+            version = question_pool._version
+            db.session.add(Question(question='rolled back', answer='answer',
+                                    difficulty=1, category=1))
+            db.session.flush()
+            self.assertEqual(question_pool._version, version)
+            db.session.rollback()
+            self.assertEqual(question_pool._version, version)
+
+            question = Question(question='committed', answer='answer',
+                                difficulty=1, category=1)
+            question.insert()
+            self.assertEqual(question_pool._version, version + 1)
+            self.assertIn(question.id, question_pool.ids())
+            question.delete()
+            self.assertNotIn(question.id, question_pool.ids())
+
+    def test_play_quiz_skips_deleted_questions(self):
+        with self.app.app_context():
+            played = [question.id for question in
+                      Question.query.filter(Question.category == '1')]
+            questions = [Question(question='stale {}'.format(i),
+                                  answer='answer', difficulty=1, category=1)
+                         for i in range(20)]
+            db.session.add_all(questions)
+            db.session.commit()
+            live = questions.pop()
+            live_id = live.id
+            self.assertIn(live_id, question_pool.ids('1'))
+
+            # Deleted elsewhere; the ids stay in the pool however often
+            # it is marked stale.
+            db.session.execute(Question.__table__.delete().where(
+                Question.id.in_([question.id for question in questions])))
+            db.session.commit()
+            with mock.patch.object(question_pool, 'mark_stale'):
+                question = next_question('1', played)
+            self.assertEqual(question.id, live_id)
+            question.delete()
+
+    def test_play_quiz_done_when_category_played_out(self):
+        played = [question.id for question in
+                  Question.query.filter(Question.category == 2)]
+        new_quiz = {
+            "quiz_category": {"type": "Art", "id": "2"},
+            "previous_questions": played
+        }
+
+        res = self.client().post('/play', json=new_quiz)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(data['success'])
+        self.assertNotIn('question', data)
+
+    def play_quiz_session(self):
+        res = self.client().post('/quizzes', json={
+            "quiz_category": {"type": "Art", "id": "2"}})
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 201)
+
+        played = []
+        for _ in range(data['total_questions'] + 1):
+            res = self.client().post(
+                '/quizzes/{}/next'.format(data['quiz_id']))
+            self.assertEqual(res.status_code, 200)
+            question = json.loads(res.data).get('question')
+            if question is None:
+                break
+            played.append(question['id'])
+
+        self.assertEqual(len(played), data['total_questions'])
+        self.assertEqual(sorted(played), sorted(
+            question.id for question in
+            Question.query.filter(Question.category == 2)))
+
+        res = self.client().delete('/quizzes/{}'.format(data['quiz_id']))
+        self.assertEqual(res.status_code, 200)
+        res = self.client().post('/quizzes/{}/next'.format(data['quiz_id']))
+        self.assertEqual(res.status_code, 404)
+
+    def test_quiz_session_deals_each_question_once(self):
+        self.play_quiz_session()
+
+    def test_quiz_session_sqlite_store(self):
+        with tempfile.TemporaryDirectory() as scratch:
+            self.app.config.update(
+                QUIZ_SESSION_STORE='sqlite',
+                QUIZ_SESSION_DB=os.path.join(scratch, 'quiz.db'))
+            self.app = create_app(self.app.config)
+            setup_db(self.app, self.database_path)
+            self.client = self.app.test_client
+            self.play_quiz_session()
+
+    def test_quiz_sessions_evict_least_recently_used(self):
+        self.app = create_app({'TESTING': True, 'QUIZ_SESSION_MAX': 2})
+        setup_db(self.app, self.database_path)
+        self.client = self.app.test_client
+        quiz_ids = [json.loads(self.client().post('/quizzes', json={
+            "quiz_category": {"type": "Art", "id": "2"}}).data)['quiz_id']
+            for _ in range(2)]
+        # using the first session makes the second the least recently used
+        self.client().post('/quizzes/{}/next'.format(quiz_ids[0]))
+        self.client().post('/quizzes', json={
+            "quiz_category": {"type": "Art", "id": "2"}})
+
+        res = self.client().post('/quizzes/{}/next'.format(quiz_ids[1]))
+        self.assertEqual(res.status_code, 404)
+        res = self.client().post('/quizzes/{}/next'.format(quiz_ids[0]))
+        self.assertEqual(res.status_code, 200)
+
+    def test_400_create_quiz_session_without_category(self):
+        res = self.client().post('/quizzes', json={})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(data['message'], 'bad request')
+
+    def test_404_play_quiz_empty_category(self):
+        new_quiz = {
+            "quiz_category": {"type": "None", "id": "9999"},
+            "previous_questions": []
+        }
+
+        res = self.client().post('/play', json=new_quiz)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(data['message'], 'resource not found')
 
 
 # Make the tests conveniently executable
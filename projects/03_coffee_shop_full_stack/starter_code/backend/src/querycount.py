@@ -0,0 +1,151 @@
+"""Per-request SQL statement counting and N+1 detection for Flask apps.
+
+    query_counter = QueryCounter(app)     # or QueryCounter().init_app(app)
+
+Every statement executed during a request is counted and timed through
+SQLAlchemy's ``before_cursor_execute``/``after_cursor_execute`` events.
+Each response gets two headers:
+
+    X-Query-Count: 3
+    Server-Timing: db;dur=4.21;desc="3 queries"
+
+Statements are also grouped by shape: the SQL text with bound values,
+literals and expanded IN lists collapsed. A shape that runs more than
+QUERYCOUNT_REPEAT_LIMIT times in one request is almost always a per-row
+query inside a loop. It is logged as a warning, or raises
+RepeatedQueryError when QUERYCOUNT_RAISE is set. QUERYCOUNT_RAISE defaults
+to the app's TESTING flag, so the test suite fails on a new N+1 pattern.
+
+The listeners are attached to the Engine class, so the counter works with
+whichever engine the app creates, including engines created lazily by
+Flask-SQLAlchemy.
+
+Each project is installed and run on its own, so this module is copied
+into all three rather than shared:
+
+    projects/01_fyyur/starter_code/querycount.py
+    projects/02_trivia_api/starter/backend/querycount.py
+    projects/03_coffee_shop_full_stack/starter_code/backend/src/querycount.py
+
+Change them together; test_querycount.py in Fyyur fails when they differ.
+"""
+import re
+import time
+from collections import Counter
+
+from flask import current_app, g, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Bound parameters in any DBAPI style, then literals, then IN lists.
+_PARAM_RE = re.compile(r"%\(\w+\)s|%s|\?|:\w+|\$\d+")
+_LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_IN_LIST_RE = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+
+
+class RepeatedQueryError(AssertionError):
+    pass
+
+
+def statement_shape(statement):
+    """Normalize ``statement`` so that repeats of one query compare equal."""
+    shape = _PARAM_RE.sub('?', statement)
+    shape = _LITERAL_RE.sub('?', shape)
+    shape = _IN_LIST_RE.sub('(?)', shape)
+    return ' '.join(shape.split())
+
+
+class RequestQueries(object):
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.shapes = Counter()
+
+    def repeated(self, limit):
+        """``[(shape, times)]`` for shapes run more than ``limit`` times."""
+        return [(shape, times) for shape, times in self.shapes.most_common()
+                if times > limit]
+
+
+def current():
+    """The current request's RequestQueries, or None outside a request."""
+    if has_request_context():
+        return g.get('_request_queries')
+    return None
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context,
+                           executemany):
+    queries = current()
+    if queries is not None:
+        queries.count += 1
+        queries.shapes[statement_shape(statement)] += 1
+        conn.info.setdefault('querycount_started', []).append(
+            time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    started = conn.info.get('querycount_started')
+    queries = current()
+    if started and queries is not None:
+        queries.seconds += time.perf_counter() - started.pop()
+
+
+def _handle_error(context):
+    # A failed statement never reaches after_cursor_execute; drop its start
+    # time so the connection's stack doesn't grow with every error.
+    connection = context.connection
+    if connection is None or context.execution_context is None or \
+            current() is None:
+        return
+    started = connection.info.get('querycount_started')
+    if started:
+        started.pop()
+
+
+class QueryCounter(object):
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('QUERYCOUNT_REPEAT_LIMIT', 10)
+        app.config.setdefault('QUERYCOUNT_RAISE', None)
+        app.extensions['querycount'] = self
+        if not event.contains(Engine, 'before_cursor_execute',
+                              _before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute',
+                         _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute',
+                         _after_cursor_execute)
+            event.listen(Engine, 'handle_error', _handle_error)
+        app.before_request(self._start)
+        app.after_request(self._finish)
+
+    @staticmethod
+    def _start():
+        g._request_queries = RequestQueries()
+
+    @staticmethod
+    def _finish(response):
+        queries = current()
+        if queries is None:
+            return response
+        response.headers['X-Query-Count'] = str(queries.count)
+        response.headers.add(
+            'Server-Timing', 'db;dur={:.2f};desc="{} queries"'.format(
+                queries.seconds * 1000, queries.count))
+
+        config = current_app.config
+        repeated = queries.repeated(config['QUERYCOUNT_REPEAT_LIMIT'])
+        if repeated:
+            message = 'Statement ran {} times in one request: {}'.format(
+                repeated[0][1], repeated[0][0])
+            should_raise = config['QUERYCOUNT_RAISE']
+            if should_raise is None:
+                should_raise = current_app.testing
+            if should_raise:
+                raise RepeatedQueryError(message)
+            current_app.logger.warning(message)
+        return response
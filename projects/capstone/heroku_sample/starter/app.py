@@ -1,6 +1,7 @@
 import os
 from flask import Flask
-from models import setup_db
+from flask_cors import CORS
+from models import setup_db, db_create_all
 
 def create_app(test_config=None):
 
@@ -8,6 +9,11 @@ def create_app(test_config=None):
     setup_db(app)
     CORS(app)
 
+    @app.cli.command('init-db')
+    def init_db():
+        '''Create the database tables.'''
+        db_create_all()
+
     @app.route('/')
     def get_greeting():
         excited = os.environ['EXCITED']